@@ -1,122 +1,408 @@
-import websocket
+import asyncio
+import logging
 import uuid
 import json
-import urllib.request
-import urllib.parse
 import random
+import struct
 import time
+import aiohttp
+import workflow_templates
 
 SERVER_ADDRESS = "127.0.0.1:8189"
 CLIENT_ID = str(uuid.uuid4())
 
-def queue_prompt(prompt_workflow):
-    p = {"prompt": prompt_workflow, "client_id": CLIENT_ID}
-    data = json.dumps(p).encode('utf-8')
-    req = urllib.request.Request(f"http://{SERVER_ADDRESS}/prompt", data=data)
-    return json.loads(urllib.request.urlopen(req).read())
+CONNECT_TIMEOUT = 5     # Seconds to open HTTP / websocket connections
+RENDER_TIMEOUT = 300    # Seconds to wait for one prompt to finish
+RECONNECT_MAX = 30      # Ceiling for the websocket reconnect backoff
 
-def get_image(filename, subfolder, folder_type):
-    data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-    url_values = urllib.parse.urlencode(data)
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/view?{url_values}") as response:
-        return response.read()
+# Batching: requests arriving within BATCH_WINDOW that share checkpoint/resolution/steps go out as one prompt
+BATCH_WINDOW = 0.4     # Seconds to hold the first request while others join
+BATCH_MAX = 4          # Images per batched prompt
+OUTPUT_NODES = ("SaveImage", "PreviewImage", workflow_templates.WS_OUTPUT_NODE)
+PREVIEW_IMAGE_EVENT = 1 # Binary frame header: event type (uint32), image format (uint32), then image bytes
 
-def get_history(prompt_id):
-    with urllib.request.urlopen(f"http://{SERVER_ADDRESS}/history/{prompt_id}") as response:
-        return json.loads(response.read())
+# Node class -> phase bucket for per-render timing
+PHASES = {
+    "CheckpointLoaderSimple": "model_load", "UnetLoaderGGUF": "model_load", "VAELoader": "model_load", "DualCLIPLoader": "model_load",
+    "CLIPTextEncode": "text_encode", "KSampler": "sampling", "KSamplerAdvanced": "sampling",
+    "VAEDecode": "vae_decode", "SaveImage": "save", workflow_templates.WS_OUTPUT_NODE: "save", "EmptyLatentImage": "latent",
+}
 
-def generate_image(positive_text, negative_text=""):
-    try:
-        # JUGGERNAUT LIGHTNING WORKFLOW (Speed + Quality)
-        workflow = {
-            "3": {
-                "inputs": {
-                    "seed": random.randint(1, 1000000000000),
-                    "steps": 6,            # Lightning needs only 4-8 steps
-                    "cfg": 2.0,            # Low CFG is critical for Lightning (1.5 - 2.0)
-                    "sampler_name": "dpmpp_sde", # SDE is best for Lightning
-                    "scheduler": "karras",
-                    "denoise": 1.0,
-                    "model": ["4", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["5", 0]
-                },
-                "class_type": "KSampler",
-                "_meta": {"title": "KSampler"}
-            },
-            "4": {
-                "inputs": {
-                    "ckpt_name": "juggernaut_lightning.safetensors"
-                },
-                "class_type": "CheckpointLoaderSimple",
-                "_meta": {"title": "Load Checkpoint"}
-            },
-            "5": {
-                "inputs": {
-                    "width": 1024,
-                    "height": 1024,
-                    "batch_size": 1
-                },
-                "class_type": "EmptyLatentImage",
-                "_meta": {"title": "Empty Latent Image"}
-            },
-            "6": {
-                "inputs": {
-                    "text": positive_text + ", masterpiece, cinematic lighting, 8k, highly detailed",
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode",
-                "_meta": {"title": "CLIP Text Encode (Positive)"}
-            },
-            "7": {
-                "inputs": {
-                    "text": "worst quality, low quality, bad anatomy, blur, noisy, distorted", 
-                    "clip": ["4", 1]
-                },
-                "class_type": "CLIPTextEncode",
-                "_meta": {"title": "CLIP Text Encode (Negative)"}
-            },
-            "8": {
-                "inputs": {
-                    "samples": ["3", 0],
-                    "vae": ["4", 2]
-                },
-                "class_type": "VAEDecode",
-                "_meta": {"title": "VAE Decode"}
-            },
-            "9": {
-                "inputs": {
-                    "filename_prefix": "Clair_Lightning",
-                    "images": ["8", 0]
-                },
-                "class_type": "SaveImage",
-                "_meta": {"title": "Save Image"}
-            }
-        }
-
-        ws = websocket.WebSocket()
-        ws.connect(f"ws://{SERVER_ADDRESS}/ws?clientId={CLIENT_ID}")
-        
-        prompt_id = queue_prompt(workflow)['prompt_id']
-        
+class ComfyError(Exception):
+    pass
+
+class RenderProgress:
+    """Live state of one prompt, fed from websocket events: current node, sampler steps, per-node timing."""
+    def __init__(self, prompt_id, workflow):
+        self.prompt_id = prompt_id
+        self.workflow = workflow
+        self.node = None
+        self.step = 0
+        self.max_steps = 0
+        self.cached = set()
+        self.done = False
+        self.node_seconds = {}
+        self.started = time.monotonic()
+        self._node_started = None
+
+    @property
+    def node_class(self):
+        node = self.workflow.get(self.node) if self.node else None
+        return node['class_type'] if node else None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def update(self, kind, data):
+        now = time.monotonic()
+        if kind == 'executing':
+            if self.node is not None and self._node_started is not None:
+                self.node_seconds[self.node] = self.node_seconds.get(self.node, 0.0) + now - self._node_started
+            self.node, self._node_started = data.get('node'), now
+            self.step = self.max_steps = 0
+            if self.node is None: self.done = True
+        elif kind == 'progress':
+            self.step, self.max_steps = data.get('value', 0), data.get('max', 0)
+        elif kind == 'execution_cached':
+            self.cached.update(data.get('nodes', []))
+
+    def phase_seconds(self):
+        phases = {}
+        for node_id, seconds in self.node_seconds.items():
+            node = self.workflow.get(node_id)
+            phase = PHASES.get(node['class_type'], "other") if node else "other"
+            phases[phase] = phases.get(phase, 0.0) + seconds
+        return {k: round(v, 2) for k, v in phases.items()}
+
+class ComfyClient:
+    """Async ComfyUI client: one long-lived websocket per client id plus a pooled HTTP session.
+
+    A single reader task owns the websocket and resolves per-prompt futures, so any number
+    of prompts can be in flight and no render pays connection setup.
+    """
+    def __init__(self, server=SERVER_ADDRESS, client_id=CLIENT_ID, render_timeout=RENDER_TIMEOUT):
+        self.server = server
+        self.client_id = client_id
+        self.render_timeout = render_timeout
+        self._session = None
+        self._reader = None
+        self._connected = asyncio.Event()
+        self._pending = {}  # prompt_id -> Future
+        self._finished = {} # Completions that arrived before the prompt was registered
+        self._progress = {} # prompt_id -> (RenderProgress, callback)
+        self._executing = (None, None) # (prompt_id, node) currently running on the server
+        self._ws_outputs = {} # prompt_id -> {node_id: [image bytes]} from websocket output nodes
+        self.timing_listeners = [] # Called with the RenderProgress of every finished render
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=60)
+            self._session = aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=8))
+        return self._session
+
+    # --- WEBSOCKET ---
+    async def connect(self):
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+        await asyncio.wait_for(self._connected.wait(), CONNECT_TIMEOUT)
+
+    async def _read_loop(self):
+        backoff = 1
+        url = f"ws://{self.server}/ws?clientId={self.client_id}"
         while True:
-            out = ws.recv()
-            if isinstance(out, str):
-                message = json.loads(out)
-                if message['type'] == 'executing':
-                    data = message['data']
-                    if data['node'] is None and data['prompt_id'] == prompt_id:
-                        break 
-        
-        history = get_history(prompt_id)[prompt_id]
-        for node_id in history['outputs']:
-            node_output = history['outputs'][node_id]
-            if 'images' in node_output:
-                for image in node_output['images']:
-                    return get_image(image['filename'], image['subfolder'], image['type'])
+            try:
+                async with self._get_session().ws_connect(url, heartbeat=30, max_msg_size=0) as ws: # Streamed PNGs easily pass the 4MB default
+                    self._connected.set()
+                    backoff = 1
+                    if self._pending: asyncio.create_task(self._reconcile())
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._dispatch(json.loads(msg.data))
+                        elif msg.type == aiohttp.WSMsgType.BINARY:
+                            self._dispatch_binary(msg.data)
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+                logging.warning(f"ComfyUI websocket error: {e}")
+            self._connected.clear()
+            logging.info(f"ComfyUI websocket closed, reconnecting in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, RECONNECT_MAX)
+
+    def _dispatch(self, message):
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if message['type'] == 'executing': self._executing = (prompt_id, data.get('node'))
+        if prompt_id in self._progress and message['type'] in ('executing', 'progress', 'execution_cached'):
+            progress, callback = self._progress[prompt_id]
+            progress.update(message['type'], data)
+            if callback:
+                try: callback(progress)
+                except Exception as e: logging.warning(f"Render progress callback failed: {e}")
+        if message['type'] == 'executing' and data.get('node') is None and prompt_id:
+            self._resolve(prompt_id, None)
+        elif message['type'] == 'execution_error' and prompt_id:
+            self._resolve(prompt_id, ComfyError(data.get('exception_message', 'execution error')))
+
+    def _dispatch_binary(self, frame):
+        """Keeps images streamed by websocket output nodes; sampler previews are dropped."""
+        prompt_id, node_id = self._executing
+        if prompt_id not in self._progress or len(frame) < 8: return
+        node = self._progress[prompt_id][0].workflow.get(node_id)
+        if node and node['class_type'] == workflow_templates.WS_OUTPUT_NODE and struct.unpack(">I", frame[:4])[0] == PREVIEW_IMAGE_EVENT:
+            self._ws_outputs.setdefault(prompt_id, {}).setdefault(node_id, []).append(frame[8:])
+
+    def _resolve(self, prompt_id, error):
+        future = self._pending.pop(prompt_id, None)
+        if future is None:
+            self._finished[prompt_id] = error
+            while len(self._finished) > 64: self._finished.pop(next(iter(self._finished)))
+        elif not future.done():
+            if error: future.set_exception(error)
+            else: future.set_result(prompt_id)
+
+    async def _reconcile(self):
+        """Completion events sent while we were disconnected are lost; recover them from history."""
+        for prompt_id in list(self._pending):
+            try:
+                if prompt_id in await self.get_history(prompt_id): self._resolve(prompt_id, None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"ComfyUI history check failed for {prompt_id}: {e}")
+
+    # --- HTTP ---
+    async def queue_prompt(self, prompt_workflow):
+        p = {"prompt": prompt_workflow, "client_id": self.client_id}
+        async with self._get_session().post(f"http://{self.server}/prompt", json=p) as r:
+            if r.status != 200: raise ComfyError(f"Queue failed ({r.status}): {await r.text()}")
+            return await r.json()
+
+    async def get_image(self, filename, subfolder, folder_type):
+        params = {"filename": filename, "subfolder": subfolder, "type": folder_type}
+        async with self._get_session().get(f"http://{self.server}/view", params=params) as r:
+            r.raise_for_status()
+            return await r.read()
+
+    async def get_history(self, prompt_id):
+        async with self._get_session().get(f"http://{self.server}/history/{prompt_id}") as r:
+            r.raise_for_status()
+            return await r.json()
+
+    async def free(self, unload_models=True, free_memory=True):
+        """Asks ComfyUI to drop cached models / free VRAM (takes effect once its queue is idle)."""
+        payload = {"unload_models": unload_models, "free_memory": free_memory}
+        try:
+            async with self._get_session().post(f"http://{self.server}/free", json=payload) as r:
+                r.raise_for_status()
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"ComfyUI free failed: {e}")
+            return False
+
+    # --- PIPELINE ---
+    async def execute(self, prompt_workflow, on_progress=None):
+        """Queues a workflow and waits for it to finish; returns the prompt_id.
+
+        `on_progress(RenderProgress)` is called synchronously for every progress/executing/cached event.
+        """
+        await self.connect()
+        prompt_id = (await self.queue_prompt(prompt_workflow))['prompt_id']
+        if prompt_id in self._finished:
+            error = self._finished.pop(prompt_id)
+            if error: raise error
+            return prompt_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[prompt_id] = future
+        progress = RenderProgress(prompt_id, prompt_workflow)
+        self._progress[prompt_id] = (progress, on_progress)
+        try:
+            return await asyncio.wait_for(future, self.render_timeout)
+        except BaseException:
+            self._ws_outputs.pop(prompt_id, None)
+            raise
+        finally:
+            self._pending.pop(prompt_id, None)
+            self._progress.pop(prompt_id, None)
+            if progress.node_seconds:
+                logging.info(f"Render {prompt_id} took {progress.elapsed:.1f}s: {progress.phase_seconds()}")
+                for listener in self.timing_listeners:
+                    try: listener(progress)
+                    except Exception as e: logging.warning(f"Render timing listener failed: {e}")
 
+    async def fetch_outputs(self, prompt_id):
+        """Downloads every output image of a finished prompt, grouped by output node id."""
+        history = (await self.get_history(prompt_id))[prompt_id]
+        outputs = {}
+        for node_id, node_output in history['outputs'].items():
+            images = node_output.get('images', [])
+            outputs[node_id] = list(await asyncio.gather(*[self.get_image(i['filename'], i['subfolder'], i['type']) for i in images]))
+        return outputs
+
+    async def get_outputs(self, prompt_id, prompt_workflow):
+        """Images of a finished prompt by output node: straight from the websocket when the graph
+        streams them (no history lookup, no disk write, no download), else via /history and /view."""
+        streamed = self._ws_outputs.pop(prompt_id, {})
+        ws_nodes = [i for i, n in prompt_workflow.items() if n['class_type'] == workflow_templates.WS_OUTPUT_NODE]
+        if ws_nodes:
+            # These nodes write no file, so frames lost to a reconnect cannot be recovered from /history
+            missing = [i for i in ws_nodes if not streamed.get(i)]
+            if missing: raise ComfyError(f"No streamed images from output node(s) {', '.join(missing)} (frames lost in transit)")
+            return streamed
+        return await self.fetch_outputs(prompt_id)
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+            try: await self._reader
+            except asyncio.CancelledError: pass
+            self._reader = None
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+class RenderRequest:
+    """One render: a workflow template plus the values patched into it (unset values use the template's)."""
+    def __init__(self, positive_text, negative_text="", width=1024, height=1024, steps=None, cfg=None, sampler=None,
+                 seed=None, template=workflow_templates.DEFAULT_TEMPLATE, on_progress=None):
+        self.template = workflow_templates.registry.get(template)
+        defaults = self.template.defaults
+        self.positive_text = positive_text
+        self.negative_text = negative_text
+        self.width = width
+        self.height = height
+        self.steps = steps or defaults["steps"]
+        self.cfg = cfg or defaults["cfg"]
+        self.sampler = sampler or defaults["sampler"]
+        self.checkpoint = self.template.checkpoint
+        self.seed = seed # None = random seed (not cacheable)
+        self.on_progress = on_progress
+
+    @property
+    def deterministic(self):
+        return self.seed is not None
+
+    def batch_key(self):
+        """Requests with equal keys can share one prompt (same model load, latent size and schedule)."""
+        return (self.template.name, self.checkpoint, self.width, self.height, self.steps)
+
+    def prompt_key(self):
+        """Requests with equal keys can share one sampler via batch_size."""
+        return self.batch_key() + (self.positive_text, self.negative_text, self.cfg, self.sampler, self.seed)
+
+    def build(self, batch_size=1):
+        seed = self.seed if self.seed is not None else random.randint(1, 1000000000000)
+        return self.template.render(self.positive_text, self.negative_text, seed=seed, steps=self.steps, cfg=self.cfg,
+                                    sampler=self.sampler, width=self.width, height=self.height, batch_size=batch_size)
+
+def _topo_order(workflow):
+    order, seen = [], set()
+    def visit(node_id):
+        if node_id in seen: return
+        seen.add(node_id)
+        for value in workflow[node_id]['inputs'].values():
+            if _is_link(value): visit(value[0])
+        order.append(node_id)
+    for node_id in workflow: visit(node_id)
+    return order
+
+def _is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+def merge_workflows(workflows):
+    """Merges several API-format graphs into one prompt, sharing every node they have in common.
+
+    Loaders (and encoders for equal text) are deduplicated, so the checkpoint loads once for the
+    whole batch. Returns (merged_graph, [output node ids of each input graph]).
+    """
+    merged, shared, outputs = {}, {}, []
+    for i, workflow in enumerate(workflows):
+        remap, own_outputs = {}, []
+        for node_id in _topo_order(workflow):
+            node = workflow[node_id]
+            inputs = {k: [remap[v[0]], v[1]] if _is_link(v) else v for k, v in node['inputs'].items()}
+            key = json.dumps([node['class_type'], inputs], sort_keys=True)
+            is_output = node['class_type'] in OUTPUT_NODES
+            if key in shared and not is_output:
+                remap[node_id] = shared[key]
+                continue
+            new_id = node_id if i == 0 else f"{node_id}_{i}"
+            merged[new_id] = dict(node, inputs=inputs)
+            shared[key] = remap[node_id] = new_id
+            if is_output: own_outputs.append(new_id)
+        outputs.append(own_outputs)
+    return merged, outputs
+
+class RenderBatcher:
+    """Coalesces render requests that arrive within `window` into batched prompts.
+
+    Identical prompts share one sampler with batch_size=n; other compatible prompts become extra
+    branches of the same graph; incompatible requests (different batch_key) go out separately.
+    """
+    def __init__(self, comfy, window=BATCH_WINDOW, max_batch=BATCH_MAX):
+        self.comfy = comfy
+        self.window = window
+        self.max_batch = max_batch
+        self._groups = {} # batch_key -> [(request, future)]
+        self._timers = {}
+        self._tasks = set()
+
+    async def submit(self, request):
+        """Queues a request and returns the list of images rendered for it."""
+        future = asyncio.get_running_loop().create_future()
+        key = request.batch_key()
+        group = self._groups.setdefault(key, [])
+        group.append((request, future))
+        if len(group) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer: timer.cancel()
+        group = self._groups.pop(key, [])
+        if group:
+            task = asyncio.create_task(self._run(group))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group):
+        by_prompt = {}
+        for request, future in group:
+            by_prompt.setdefault(request.prompt_key(), []).append((request, future))
+        members = list(by_prompt.values())
+        try:
+            # Identical seeded requests want the *same* image, so they share one render instead of a batch
+            graph, outputs = merge_workflows([m[0][0].build(batch_size=1 if m[0][0].deterministic else len(m)) for m in members])
+            logging.info(f"Render batch: {len(group)} requests, {len(members)} branches")
+            callbacks = [r.on_progress for r, _ in group if r.on_progress]
+            fanout = (lambda progress: [cb(progress) for cb in callbacks]) if callbacks else None
+            prompt_id = await self.comfy.execute(graph, on_progress=fanout)
+            images = await self.comfy.get_outputs(prompt_id, graph)
+        except Exception as e:
+            for _, future in group:
+                if not future.done(): future.set_exception(e)
+            return
+        for member, output_ids in zip(members, outputs):
+            branch = [img for node_id in output_ids for img in images.get(node_id, [])]
+            shared = member[0][0].deterministic
+            per = max(1, len(branch) // len(member))
+            for j, (_, future) in enumerate(member):
+                if not future.done(): future.set_result(list(branch) if shared else branch[j * per:(j + 1) * per])
+
+client = ComfyClient()
+batcher = RenderBatcher(client)
+
+async def generate_images(request):
+    """Renders a RenderRequest through the batcher; returns its images ([] on failure)."""
+    try:
+        return await batcher.submit(request)
     except Exception as e:
-        print(f"Generate Error: {e}")
-        return None
-    return None
+        logging.error(f"Generate Error: {e}")
+        return []
+
+async def free():
+    return await client.free()
+
+async def close():
+    await client.close()
@@ -0,0 +1,64 @@
+import re
+
+CONTEXT_TOKEN_BUDGET = 3072 # Prompt tokens per request (leave headroom under the model's num_ctx for the reply)
+INTEL_SHARE = 0.25          # Max fraction of the budget retrieved intel may take
+USER_SHARE = 0.5            # Max fraction of the budget the new user turn may take (pasted logs get cut)
+MESSAGE_OVERHEAD = 4        # Role markers / separators the chat template adds per message
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    """Cheap llama-style token estimate: words and punctuation, with long words costing extra pieces."""
+    if not text: return 0
+    return sum(1 + len(t) // 6 for t in _TOKEN_RE.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    """Keeps whole lines from the top of `text` until the budget is spent (a first line that alone is too long is cut mid-line)."""
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            if not kept: kept.append(_truncate_line(line, max_tokens - 1))
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+def _truncate_line(line, max_tokens):
+    end = 0
+    for m in _TOKEN_RE.finditer(line):
+        max_tokens -= 1 + len(m.group()) // 6
+        if max_tokens < 0: break
+        end = m.end()
+    return line[:end]
+
+class ContextBuilder:
+    """Assembles the chat payload under a token budget.
+
+    Fixed costs (system prompt, capped intel, rolling summary, the capped new user turn) are paid first;
+    history is then filled newest to oldest until the budget runs out.
+    """
+    def __init__(self, budget=CONTEXT_TOKEN_BUDGET, intel_share=INTEL_SHARE, user_share=USER_SHARE):
+        self.budget = budget
+        self.intel_share = intel_share
+        self.user_share = user_share
+
+    def build(self, system_fn, retrieved_memory, summary, history, user_msg):
+        """Returns (messages, dropped) where dropped is how many of the oldest history turns did not fit."""
+        if retrieved_memory:
+            retrieved_memory = truncate_to_tokens(retrieved_memory, int(self.budget * self.intel_share)) or None
+        system = system_fn(retrieved_memory)
+        if summary:
+            system += f"\n[CONVERSATION SUMMARY]\n{summary}\n"
+        user_cap = int(self.budget * self.user_share)
+        if count_tokens(user_msg["content"]) > user_cap:
+            user_msg = {**user_msg, "content": truncate_to_tokens(user_msg["content"], user_cap)}
+        remaining = self.budget - count_tokens(system) - count_tokens(user_msg["content"]) - 2 * MESSAGE_OVERHEAD
+        kept = []
+        for msg in reversed(history):
+            cost = count_tokens(msg["content"]) + MESSAGE_OVERHEAD
+            if cost > remaining: break
+            kept.append({"role": msg["role"], "content": msg["content"]}) # History rows may carry ids; the model only needs these
+            remaining -= cost
+        kept.reverse()
+        return [{"role": "system", "content": system}] + kept + [user_msg], len(history) - len(kept)
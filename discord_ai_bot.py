@@ -3,18 +3,31 @@ import io
 import asyncio
 import logging
 import sqlite3
+import threading
+import queue
+import signal
 import discord
-import requests
 import random
 import psutil
-import subprocess
-import json
-import base64
+import time
+import re
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 import comfy_client
+import workflow_templates
+import render_cache
+import gpu_scheduler
+import ollama_client
+import context_builder
+import vector_index
+import news_pipeline
+import telemetry
+import vision_preprocess
+import metrics
+import aiohttp
 
 # --- INIT ---
 load_dotenv()
@@ -22,16 +35,52 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # --- CONFIGURATION ---
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-OLLAMA_GEN_URL = "http://localhost:11434/api/generate"
-OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_MAX_CONCURRENT = 4 # Parallel generations across channels
+OLLAMA_TIMEOUT = 300 # Seconds per full reply
+STREAM_REPLIES = True # Edit replies in place as tokens arrive
+STREAM_EDIT_INTERVAL = 1.2 # Seconds between edits (Discord allows ~5 edits / 5s)
+PROGRESS_EDIT_INTERVAL = 2.0 # Seconds between /imagine progress edits
+DISCORD_MSG_LIMIT = 2000
+CONTEXT_TOKEN_BUDGET = 3072 # Prompt tokens for system + intel + summary + history
+SUMMARY_EVERY = 8 # Saved messages between background summary refreshes
+SUMMARY_BATCH = 40 # Max old turns folded into the summary per refresh
+RETRIEVAL_BUDGET = 0.35 # Seconds semantic recall may add to a reply before it is skipped
+RETRIEVAL_TOP_K = 3
+RETRIEVAL_MIN_SCORE = 0.55 # Cosine similarity floor for a hit to reach the prompt
+INTEL_INDEX_INTERVAL = 300 # Seconds between background embedding passes over news_history
+INTEL_INDEX_BATCH = 32 # Rows embedded per scheduler job
+NEWS_INTERVAL = 900 # Seconds between background feed scans
+NEWS_FRESHNESS = 600 # !news skips the live scan if the last one is newer than this
+TELEMETRY_INTERVAL = 5 # Seconds between CPU / RAM / GPU samples
+TELEMETRY_MINUTES = 15 # History kept for !status
+METRICS_HOST = os.getenv("METRICS_HOST", metrics.METRICS_HOST) # Loopback by default; the Dockerfile sets 0.0.0.0
+METRICS_PORT = 8080 # Prometheus /metrics (the port the Dockerfile serves)
 TEXT_MODEL = "dolphin-llama3"
 VISION_MODEL = "llava" # <--- NEW: The Eye
-OLLAMA_KEEP_ALIVE = "5m"
+EMBED_MODEL = "nomic-embed-text" # Semantic memory
+KEEP_ALIVE_MIN = 300 # Seconds; adaptive keep_alive never goes below this...
+KEEP_ALIVE_MAX = 1800 # ...and falls back to the minimum when traffic is sparser than this
+IDLE_HANDOFF_DELAY = 5 # Seconds the GPU idles after renders before chat models are preloaded
 OWNER_ID = "303278216343453696"
 
 # PATHS
 DB_PATH = "clair_memory.db"
 INTEL_DB_PATH = "/mnt/intel/clair_news.db"
+RENDER_CACHE_DIR = "render_cache"
+VECTOR_INDEX_PATH = "clair_vectors"
+RENDER_CACHE_MAX_MB = 2048
+DETERMINISTIC_RENDERS = False # Opt-in: seed from the prompt so repeats are served from the render cache
+
+IMAGE_EXTS = ['png', 'jpg', 'jpeg', 'webp']
+# Words ignored when turning a chat message into an intel search query
+SEARCH_STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "her", "was", "one", "our", "out",
+    "has", "have", "his", "how", "its", "may", "new", "now", "see", "who", "did", "get", "got", "let", "she", "too",
+    "use", "what", "when", "where", "which", "why", "with", "that", "this", "there", "their", "them", "then", "they",
+    "from", "about", "into", "just", "like", "some", "than", "been", "were", "will", "would", "could", "should",
+    "tell", "know", "news", "latest", "update", "happened", "clair", "please", "hey",
+}
 
 BLOCKED_TERMS = ["child", "kid", "minor", "underage", "rape", "gore", "baby"]
 
@@ -50,38 +99,65 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+# --- METRICS ---
+RENDER_BUCKETS = (0.5, 1, 2, 4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128, 192, 300)
+CHAT_LATENCY = metrics.registry.histogram("clair_chat_seconds", "Chat job time from dequeue to full reply")
+CHAT_TTFT = metrics.registry.histogram("clair_chat_ttft_seconds", "Chat job time from dequeue to first streamed token")
+RENDER_SECONDS = metrics.registry.histogram("clair_render_seconds", "ComfyUI render time per phase", RENDER_BUCKETS)
+DB_LATENCY = metrics.registry.histogram("clair_db_seconds", "SQLite call latency")
+GPU_SWITCH_SECONDS = metrics.registry.histogram("clair_gpu_switch_seconds", "Time spent handing the GPU between modes")
+MODEL_PRELOAD_SECONDS = metrics.registry.histogram("clair_model_preload_seconds", "Background Ollama model loads after a handoff")
+CACHE_EVENTS = metrics.registry.counter("clair_cache_events_total", "Render / vision cache lookups", source=lambda: [
+    ({"cache": "render", "result": "hit"}, renders.hits), ({"cache": "render", "result": "miss"}, renders.misses),
+    ({"cache": "vision", "result": "hit"}, vision.hits), ({"cache": "vision", "result": "miss"}, vision.misses)])
+MODEL_SWAPS = metrics.registry.counter("clair_model_swaps_total", "GPU mode switches", source=lambda: [
+    ({"transition": k}, v) for k, v in res_man.scheduler.switch_counts.items()])
+QUEUE_DEPTH = metrics.registry.gauge("clair_gpu_queue_depth", "Jobs waiting for the GPU", source=lambda: [
+    ({"mode": m}, len(q)) for m, q in res_man.scheduler.queues.items()])
+GPU_RUNNING = metrics.registry.gauge("clair_gpu_running", "Jobs currently on the GPU", source=lambda: [({}, res_man.scheduler.running)])
+GPU_MODE = metrics.registry.gauge("clair_gpu_mode", "1 for the mode currently holding the GPU", source=lambda: [
+    ({"mode": m}, int(res_man.scheduler.mode == m)) for m in gpu_scheduler.PRIORITY])
+
+def observe_render(progress):
+    for phase, seconds in progress.phase_seconds().items(): RENDER_SECONDS.observe(seconds, phase=phase)
+    RENDER_SECONDS.observe(progress.elapsed, phase="total")
+
+def format_latency(label, histogram, scale=1, unit="s", **labels):
+    q = histogram.quantiles(**labels)
+    return f"{label} {q[0] * scale:.1f}{unit}/{q[1] * scale:.1f}{unit}" if q else f"{label} n/a"
+
 # --- HARDWARE FUNCTIONS ---
-def get_gpu_stats():
-    """Queries ROCm for 7900 XT stats"""
-    try:
-        result = subprocess.run(
-            ["rocm-smi", "--showmeminfo", "vram", "--showuse", "--showtemp", "--json"],
-            capture_output=True, text=True
-        )
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            card = next(iter(data.values()))
-            temp = card.get("Temperature (Sensor edge) (C)", "N/A")
-            vram_used = card.get("VRAM Total Memory (B)", 0) // (1024**2)
-            load = card.get("GPU use (%)", 0)
-            return f"**GPU (7900 XT):** {load}% Load | {temp}°C | VRAM: {vram_used}MB Used"
-    except Exception:
-        pass
-    return "**GPU:** ROCm Telemetry Unavailable"
+def format_metric(label, stat, unit="%", fmt="{:.0f}"):
+    if stat is None: return f"**{label}:** n/a"
+    cur, lo, avg, hi, spark = stat
+    f = lambda v: fmt.format(v) + unit
+    return f"**{label}:** {f(cur)} `{spark}` ({f(lo)} / {f(avg)} / {f(hi)})"
+
+def format_gpu_queue():
+    st = res_man.scheduler.stats()
+    queued = sum(st["queued"].values())
+    return f"**GPU Queue:** {st['mode'] or 'idle'} | {st['running']} running, {queued} queued | {st['switches']} swaps ({st['switch_seconds']}s)"
 
 async def send_status_report(channel):
-    cpu = psutil.cpu_percent()
-    ram = psutil.virtual_memory()
-    gpu_msg = await asyncio.to_thread(get_gpu_stats)
+    now = sampler.latest
+    vram_total = f" of {now.vram_total}MB" if now and now.vram_total else ""
     boot_time = datetime.fromtimestamp(psutil.boot_time())
     delta = datetime.now() - boot_time
     uptime_str = str(delta).split('.')[0]
+    cache = renders.stats()
 
     msg = (
-        f"📊 **SYSTEM STATUS REPORT**\n"
+        f"📊 **SYSTEM STATUS REPORT** (last {TELEMETRY_MINUTES}m: min / avg / max)\n"
         f"━━━━━━━━━━━━━━━━━━━━━━\n"
-        f"**CPU:** {cpu}% | **RAM:** {ram.percent}%\n"
-        f"{gpu_msg}\n"
+        f"{format_metric('CPU', sampler.summary('cpu'))}\n"
+        f"{format_metric('RAM', sampler.summary('ram'))}\n"
+        f"{format_metric('GPU (7900 XT)', sampler.summary('gpu_load'))}\n"
+        f"{format_metric('GPU Temp', sampler.summary('gpu_temp'), unit='°C')}\n"
+        f"{format_metric('VRAM', sampler.summary('vram_used'), unit='MB')}{vram_total}\n"
+        f"{format_gpu_queue()}\n"
+        f"**Latency p50/p95:** {format_latency('chat', CHAT_LATENCY)} | {format_latency('TTFT', CHAT_TTFT)} | "
+        f"{format_latency('render', RENDER_SECONDS, phase='total')} | {format_latency('DB', DB_LATENCY, 1000, 'ms')}\n"
+        f"**Render Cache:** {cache['hits']} hits / {cache['misses']} misses | {cache['entries']} renders, {cache['bytes'] / 1024**2:.0f} of {RENDER_CACHE_MAX_MB}MB\n"
         f"**Uptime:** {uptime_str}\n"
         f"━━━━━━━━━━━━━━━━━━━━━━\n"
         f"✅ *All Systems Nominal.*"
@@ -90,48 +166,110 @@ async def send_status_report(channel):
 
 # --- NEWS FUNCTIONS ---
 async def run_news_briefing(channel):
-    script_path = "/mnt/intel/briefing.py"
-    working_dir = "/mnt/intel/"
-    await channel.send("🌍 **Initiating Global Intelligence Scan...**")
-
-    def run_script():
-        try:
-            result = subprocess.run(
-                ["python3", script_path],
-                capture_output=True, text=True, check=True, cwd=working_dir, timeout=45
-            )
-            return result.stdout
-        except subprocess.TimeoutExpired: return "❌ ERROR: Watchdog timed out."
-        except subprocess.CalledProcessError as e: return f"❌ ERROR: {e.stderr}"
-        except FileNotFoundError: return f"❌ ERROR: Could not find script."
-
-    output = await asyncio.to_thread(run_script)
-    if "ERROR" in output:
-        await channel.send(f"⚠️ **Scan Failed.**\n`{output}`")
-        return
-
-    report = intel_db.get_recent_headlines(limit=5)
+    if not news.is_fresh(NEWS_FRESHNESS): # The background loop usually got there first
+        await channel.send("🌍 **Initiating Global Intelligence Scan...**")
+        async for name, new, error in news.scan():
+            if error:
+                await channel.send(f"⚠️ `{name}`: {error}")
+            elif new:
+                lines = "\n".join(f"• [{i['headline']}](<{i['link']}>)" for i in new[:3])
+                await channel.send(f"📡 `{name}`: {len(new)} new\n{lines}")
+        if not news.store.ready:
+            await channel.send("⚠️ **Scan Failed.** Intel database unavailable.")
+            return
+
+    report = await asyncio.to_thread(intel_db.get_recent_headlines, 5)
     await channel.send(f"📰 **Intelligence Briefing**\n\n{report}")
 
 # --- INTELLIGENCE MANAGER ---
 class IntelManager:
+    """Read side of the intel DB: one pooled read-only connection plus a threat summary that is only
+    recomputed when the database actually changes. Methods block; async callers use asyncio.to_thread.
+    """
+    NO_THREATS = "No active critical threats."
+
     def __init__(self, db_path):
         self.db_path = db_path
+        self.threats = self.NO_THREATS # Last computed summary; reading it costs nothing
+        self._threats_key = None
+        self._conn = None
+        self._conn_ino = None
+        self._lock = threading.Lock()
+        self.fts_ready = False # LIKE search until ensure_search_index() runs at startup
+
+    def ensure_search_index(self):
+        """Creates an FTS5 index over news_history (kept in sync by triggers, so briefing.py writes are covered).
+        Writes to the intel DB, so only bot startup calls it; returns whether FTS search is available."""
+        self.fts_ready = self._build_search_index()
+        return self.fts_ready
+
+    def _build_search_index(self):
+        if not os.path.exists(self.db_path): return False
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            try:
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='news_fts'").fetchone()
+                if not exists:
+                    with conn:
+                        conn.execute("CREATE VIRTUAL TABLE news_fts USING fts5(headline, summary, content='news_history', content_rowid='rowid', tokenize='porter unicode61')")
+                        conn.execute("CREATE TRIGGER IF NOT EXISTS news_fts_ai AFTER INSERT ON news_history BEGIN INSERT INTO news_fts(rowid, headline, summary) VALUES (new.rowid, new.headline, new.summary); END")
+                        conn.execute("CREATE TRIGGER IF NOT EXISTS news_fts_ad AFTER DELETE ON news_history BEGIN INSERT INTO news_fts(news_fts, rowid, headline, summary) VALUES ('delete', old.rowid, old.headline, old.summary); END")
+                        conn.execute("CREATE TRIGGER IF NOT EXISTS news_fts_au AFTER UPDATE ON news_history BEGIN INSERT INTO news_fts(news_fts, rowid, headline, summary) VALUES ('delete', old.rowid, old.headline, old.summary); INSERT INTO news_fts(rowid, headline, summary) VALUES (new.rowid, new.headline, new.summary); END")
+                        conn.execute("INSERT INTO news_fts(news_fts) VALUES ('rebuild')")
+                    logging.info("Built FTS5 search index for news_history")
+            finally: conn.close()
+            return True
+        except sqlite3.Error as e:
+            logging.warning(f"Intel FTS index unavailable, using LIKE search: {e}")
+            return False
+
+    @staticmethod
+    def extract_keywords(text, limit=8):
+        words = []
+        for w in re.findall(r"[a-z0-9][a-z0-9\-\.]{2,}", text.lower()):
+            w = w.strip(".-")
+            if len(w) >= 3 and w not in SEARCH_STOPWORDS and w not in words: words.append(w)
+        return words[:limit]
+
+    def _get_conn(self):
+        # Caller holds _lock. Reconnect if the file was replaced (new inode) under us.
+        ino = os.stat(self.db_path).st_ino
+        if self._conn is None or ino != self._conn_ino:
+            if self._conn: self._conn.close()
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn_ino = ino
+        return self._conn
 
     def _query(self, sql, params=()):
         if not os.path.exists(self.db_path): return []
-        try:
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
-            cursor = conn.execute(sql, params)
-            rows = cursor.fetchall()
-            conn.close()
-            return rows
-        except Exception: return []
+        with self._lock:
+            try:
+                with DB_LATENCY.time(op="intel_query"): return self._get_conn().execute(sql, params).fetchall()
+            except sqlite3.Error:
+                if self._conn: self._conn.close()
+                self._conn = None
+                return []
+
+    def _version(self):
+        """Changes whenever another connection commits (data_version) or the file is swapped (inode)."""
+        if not os.path.exists(self.db_path): return None
+        with self._lock:
+            try:
+                conn = self._get_conn()
+                return (self._conn_ino, conn.execute("PRAGMA data_version").fetchone()[0])
+            except sqlite3.Error:
+                return None
 
     def get_latest_threats(self, limit=3):
+        key = (self._version(), limit)
+        if key[0] is not None and key == self._threats_key: return self.threats
         rows = self._query("SELECT headline FROM news_history WHERE priority='CRITICAL' ORDER BY timestamp DESC LIMIT ?", (limit,))
-        if not rows: return "No active critical threats."
-        return "CRITICAL ALERTS: " + ", ".join([r[0] for r in rows])
+        self.threats = "CRITICAL ALERTS: " + ", ".join([r[0] for r in rows]) if rows else self.NO_THREATS
+        self._threats_key = key
+        return self.threats
+
+    async def refresh_threats(self):
+        return await asyncio.to_thread(self.get_latest_threats)
 
     def get_recent_headlines(self, limit=5):
         rows = self._query("SELECT headline, priority, source, link FROM news_history ORDER BY timestamp DESC LIMIT ?", (limit,))
@@ -142,10 +280,22 @@ class IntelManager:
             report += f"{icon} **[{r[2]}]** [{r[0]}]({r[3]})\n"
         return report
 
-    def search_memory(self, query):
-        sql = "SELECT headline, source, summary FROM news_history WHERE headline LIKE ? OR summary LIKE ? ORDER BY timestamp DESC LIMIT 3"
-        wildcard = f"%{query}%"
-        rows = self._query(sql, (wildcard, wildcard))
+    def get_rows_after(self, rowid, limit=64):
+        return self._query("SELECT rowid, headline, source, summary FROM news_history WHERE rowid > ? ORDER BY rowid LIMIT ?", (rowid, limit))
+
+    def search_memory(self, query, limit=3):
+        keywords = self.extract_keywords(query)
+        if not keywords: return None
+        if self.fts_ready:
+            # Any keyword may match; bm25 ranks rows hitting more (and rarer) terms first, headline weighted 2x
+            match = " OR ".join('"' + k.replace('"', '') + '"' for k in keywords)
+            sql = ("SELECT n.headline, n.source, n.summary FROM news_fts JOIN news_history n ON n.rowid = news_fts.rowid "
+                   "WHERE news_fts MATCH ? ORDER BY bm25(news_fts, 2.0, 1.0) LIMIT ?")
+            rows = self._query(sql, (match, limit))
+        else:
+            clauses = " OR ".join(["headline LIKE ? OR summary LIKE ?"] * len(keywords))
+            params = [p for k in keywords for p in (f"%{k}%", f"%{k}%")]
+            rows = self._query(f"SELECT headline, source, summary FROM news_history WHERE {clauses} ORDER BY timestamp DESC LIMIT ?", (*params, limit))
         if not rows: return None
         context = "RELEVANT INTEL FOUND IN MEMORY:\n"
         for r in rows:
@@ -154,44 +304,299 @@ class IntelManager:
 
 # --- DATABASE MANAGERS ---
 class PersistenceManager:
-    def __init__(self, db_path):
+    """Write-behind chat store: saves are queued and a writer thread commits them in batches.
+
+    Rows get their id when queued, so readers can merge committed and still-pending rows without
+    duplicates, and the writer only takes `_lock` to retire rows after its transaction.
+    Reads come from a per-channel ring buffer (filled lazily from SQLite, LRU across channels),
+    so context lookups cost O(window) however large the table grows; close() drains the queue.
+    """
+    PRAGMAS = ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA temp_store=MEMORY",
+               "PRAGMA cache_size=-16000", "PRAGMA busy_timeout=5000")
+    def __init__(self, db_path, flush_interval=0.5, batch_size=256, window=32, max_channels=256, write_retries=3):
         self.db_path = db_path
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.write_retries = write_retries
+        self.window = window
+        self.max_channels = max_channels
+        self._windows = OrderedDict() # channel_id -> deque of (id, role, content), most recently used last
+        self._summaries = {} # channel_id -> (summary, upto_id)
+        self._since_summary = {} # channel_id -> messages saved since the last summary refresh
+        self.conn = self._connect()
         self._init_db()
+        self._lock = threading.Lock() # Guards in-memory state only, never held across a write
+        self._pending = [] # Queued (id, channel_id, role, content) rows, oldest first
+        self._next_id = (self.conn.execute("SELECT MAX(id) FROM chat_history").fetchone()[0] or 0) + 1
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="clair-db-writer", daemon=True)
+        self._writer.start()
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in self.PRAGMAS: conn.execute(pragma)
+        return conn
     def _init_db(self):
         self.conn.execute('''CREATE TABLE IF NOT EXISTS chat_history (id INTEGER PRIMARY KEY, channel_id INTEGER, role TEXT, content TEXT)''')
+        self.conn.execute('''CREATE INDEX IF NOT EXISTS idx_chat_channel ON chat_history (channel_id, id)''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS channel_summaries (channel_id INTEGER PRIMARY KEY, summary TEXT, upto_id INTEGER)''')
         self.conn.commit()
     def save_message(self, channel_id, role, content):
-        self.conn.execute("INSERT INTO chat_history (channel_id, role, content) VALUES (?, ?, ?)", (channel_id, role, content))
-        self.conn.commit()
-    def get_recent_context(self, channel_id, limit=6):
-        cursor = self.conn.execute("SELECT role, content FROM chat_history WHERE channel_id=? ORDER BY id DESC LIMIT ?", (channel_id, limit))
+        with self._lock:
+            row = (self._next_id, channel_id, role, content)
+            self._next_id += 1
+            self._pending.append(row)
+            self._queue.put(row)
+            if channel_id in self._windows: self._windows[channel_id].append(row[:1] + row[2:])
+            self._since_summary[channel_id] = self._since_summary.get(channel_id, 0) + 1
+        return row[0]
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            try: batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty: continue
+            while len(batch) < self.batch_size:
+                try: batch.append(self._queue.get_nowait())
+                except queue.Empty: break
+            rows = [r for r in batch if r is not None]
+            if rows: self._commit(conn, rows)
+            for _ in batch: self._queue.task_done()
+            if None in batch: break
+        conn.close()
+    def _commit(self, conn, rows):
+        stored = False
+        for attempt in range(1, self.write_retries + 1):
+            try:
+                with DB_LATENCY.time(op="chat_write"), conn: conn.executemany("INSERT INTO chat_history (id, channel_id, role, content) VALUES (?, ?, ?, ?)", rows)
+                stored = True
+                break
+            except sqlite3.Error as e:
+                logging.error(f"DB Write Error (attempt {attempt}/{self.write_retries}): {e}")
+                if attempt == self.write_retries:
+                    logging.error(f"Dropped {len(rows)} chat rows: ids {rows[0][0]}..{rows[-1][0]}")
+                else:
+                    time.sleep(self.flush_interval * attempt)
+        attempted = {r[0] for r in rows}
+        with self._lock: # Retire exactly what was attempted, whatever the outcome
+            self._pending = [r for r in self._pending if r[0] not in attempted]
+            if not stored: # Ring buffers must not keep serving rows that never reached the DB
+                for channel_id in {r[1] for r in rows} & self._windows.keys():
+                    self._windows[channel_id] = deque((w for w in self._windows[channel_id] if w[0] not in attempted), maxlen=self.window)
+    def flush(self):
+        """Blocks until every queued write is committed."""
+        self._queue.join()
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        try: self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)") # Fold the WAL into the main file (the bind mount only covers that)
+        except sqlite3.Error as e: logging.warning(f"WAL checkpoint failed: {e}")
+        self.conn.close()
+    def _load_recent(self, channel_id, limit):
+        # Caller holds _lock: committed rows plus the unflushed tail, oldest first, deduped by id
+        # (a batch may be committed but not yet retired from _pending)
+        with DB_LATENCY.time(op="chat_read"):
+            rows = self.conn.execute("SELECT id, role, content FROM chat_history WHERE channel_id=? ORDER BY id DESC LIMIT ?", (channel_id, limit)).fetchall()
+        merged = {r[0]: r for r in rows}
+        merged.update((r[0], r[:1] + r[2:]) for r in self._pending if r[1] == channel_id)
+        return [merged[i] for i in sorted(merged)][-limit:]
+    def _get_window(self, channel_id):
+        # Caller holds _lock
+        if channel_id in self._windows:
+            self._windows.move_to_end(channel_id)
+        else:
+            self._windows[channel_id] = deque(self._load_recent(channel_id, self.window), maxlen=self.window)
+            while len(self._windows) > self.max_channels: self._windows.popitem(last=False)
+        return self._windows[channel_id]
+    def get_summary(self, channel_id):
+        """Rolling summary of turns that no longer fit the prompt: (summary or None, last folded id)."""
+        with self._lock:
+            if channel_id not in self._summaries:
+                with DB_LATENCY.time(op="summary_read"):
+                    row = self.conn.execute("SELECT summary, upto_id FROM channel_summaries WHERE channel_id=?", (channel_id,)).fetchone()
+                self._summaries[channel_id] = row or (None, 0)
+            return self._summaries[channel_id]
+    def save_summary(self, channel_id, summary, upto_id):
+        conn = self._connect() # Own connection: may wait on the writer, so never under _lock
+        try:
+            with DB_LATENCY.time(op="summary_write"), conn: conn.execute("INSERT OR REPLACE INTO channel_summaries (channel_id, summary, upto_id) VALUES (?, ?, ?)", (channel_id, summary, upto_id))
+        finally: conn.close()
+        with self._lock: self._summaries[channel_id] = (summary, upto_id)
+    def summary_due(self, channel_id, every=SUMMARY_EVERY):
+        return self._since_summary.get(channel_id, 0) >= every
+    def get_unsummarized(self, channel_id, after_id, before_id, limit):
+        """Oldest committed turns with after_id < id < before_id (before_id = oldest turn the prompt still holds)."""
+        with self._lock:
+            self._since_summary[channel_id] = 0
+            with DB_LATENCY.time(op="chat_read"):
+                return self.conn.execute(
+                    "SELECT id, role, content FROM chat_history WHERE channel_id=? AND id>? AND id<? ORDER BY id LIMIT ?",
+                    (channel_id, after_id, before_id, limit)).fetchall()
+    def get_recent_context(self, channel_id, limit=6, after_id=0):
+        """Last `limit` turns newer than `after_id` as chat messages, each tagged with its row id."""
+        with self._lock:
+            if limit <= self.window: rows = list(self._get_window(channel_id))[-limit:]
+            else: rows = self._load_recent(channel_id, limit)
         history = []
-        for r in reversed(cursor.fetchall()):
-            history.append({"role": "assistant" if r[0] == "Clair" else "user", "content": r[1]})
+        for r in rows:
+            if r[0] > after_id: history.append({"id": r[0], "role": "assistant" if r[1] == "Clair" else "user", "content": r[2]})
         return history
 
 class ResourceManager:
+    """VRAM traffic cop. The scheduler owns the GPU and calls `_switch_mode` between batches.
+
+    Handing the GPU to ComfyUI evicts every resident Ollama model. Handing it back frees ComfyUI's
+    cache first, then preloads the models the queued jobs need (or, when idle, the ones recent
+    traffic used) in the background, so cold loads overlap the handoff instead of the next reply.
+    """
+    MODE_MODELS = {gpu_scheduler.CHAT: (TEXT_MODEL, EMBED_MODEL), gpu_scheduler.VISION: (VISION_MODEL,)}
+
     def __init__(self):
-        self.gpu_locked = False
+        self.scheduler = gpu_scheduler.GpuScheduler(self._switch_mode, concurrency={
+            gpu_scheduler.CHAT: OLLAMA_MAX_CONCURRENT,
+            gpu_scheduler.IMAGE: comfy_client.BATCH_MAX, # Lets concurrent renders coalesce into one batch
+        }, idle_mode=gpu_scheduler.CHAT, idle_delay=IDLE_HANDOFF_DELAY)
+        self.traffic = {} # model -> recent user request times
+        self._preload = None
+    @property
+    def gpu_locked(self):
+        return self.scheduler.mode == gpu_scheduler.IMAGE
+    def submit(self, mode, fn, *args):
+        return self.scheduler.submit(mode, fn, *args)
+
+    # --- TRAFFIC ---
+    def note_use(self, model):
+        self.traffic.setdefault(model, deque(maxlen=16)).append(time.monotonic())
+    def keep_alive_for(self, model):
+        """Seconds to keep a model resident: 1.5x the typical gap between its recent requests,
+        or the minimum when traffic is too sparse for staying loaded to pay off."""
+        times = list(self.traffic.get(model, ()))
+        if len(times) < 2: return KEEP_ALIVE_MIN
+        gaps = sorted(b - a for a, b in zip(times, times[1:]))
+        wanted = gaps[len(gaps) // 2] * 1.5
+        return int(wanted) if KEEP_ALIVE_MIN < wanted <= KEEP_ALIVE_MAX else KEEP_ALIVE_MIN
+    def expected_models(self):
+        queued = [m for mode in self.scheduler.upcoming() for m in self.MODE_MODELS.get(mode, ())]
+        if queued: return list(dict.fromkeys(queued))
+        horizon = time.monotonic() - KEEP_ALIVE_MAX
+        recent = sorted((t[-1], m) for m, t in self.traffic.items() if t and t[-1] > horizon)
+        return [m for _, m in reversed(recent)] or [TEXT_MODEL, EMBED_MODEL]
+
+    # --- HANDOFF ---
+    async def _switch_mode(self, old, new):
+        with GPU_SWITCH_SECONDS.time(to=new):
+            if new == gpu_scheduler.IMAGE: await self.engage_gpu_mode()
+            elif old == gpu_scheduler.IMAGE: await self.engage_chat_mode()
     async def engage_gpu_mode(self):
-        if self.gpu_locked: return False
-        self.gpu_locked = True
-        try: requests.post(OLLAMA_GEN_URL, json={"model": TEXT_MODEL, "keep_alive": 0})
-        except: pass
+        if self._preload and not self._preload.done(): await self._preload # Never unload under an in-flight load
+        for model in (await ollama.loaded()) or (TEXT_MODEL, VISION_MODEL, EMBED_MODEL): await ollama.unload(model)
         return True
     async def engage_chat_mode(self):
-        self.gpu_locked = False
+        await comfy_client.free() # ComfyUI's cached checkpoints would otherwise crowd out the Ollama load
+        self.preload(self.expected_models())
+    def preload(self, models):
+        if self._preload and not self._preload.done(): return
+        self._preload = asyncio.create_task(self._preload_models(models))
+    async def _preload_models(self, models):
+        for model in models:
+            with MODEL_PRELOAD_SECONDS.time(model=model):
+                await ollama.preload(model, self.keep_alive_for(model), embedding=model == EMBED_MODEL)
+
+class StreamingReply:
+    """Renders a streamed reply into Discord, editing in place and rolling over at the message limit.
+
+    Fragments are buffered and pushed at most once per `interval`, so token rate never maps to edit rate.
+    """
+    def __init__(self, channel, interval=STREAM_EDIT_INTERVAL, limit=DISCORD_MSG_LIMIT):
+        self.channel = channel
+        self.interval = interval
+        self.limit = limit
+        self.text = ""
+        self._offset = 0 # Start of the part of `text` owned by the current message
+        self._current = None
+        self._shown = ""
+        self._last_flush = 0.0
+
+    async def feed(self, fragment):
+        self.text += fragment
+        if time.monotonic() - self._last_flush >= self.interval:
+            await self._flush()
+
+    async def finish(self):
+        await self._flush()
+        return self.text
+
+    def _split_point(self):
+        end = self._offset + self.limit
+        cut = max(self.text.rfind("\n", self._offset, end), self.text.rfind(" ", self._offset, end))
+        return cut + 1 if cut > self._offset else end
+
+    async def _flush(self):
+        while len(self.text) - self._offset > self.limit:
+            cut = self._split_point()
+            await self._render(self.text[self._offset:cut])
+            self._offset, self._current, self._shown = cut, None, ""
+        body = self.text[self._offset:]
+        if body.strip(): await self._render(body)
+        self._last_flush = time.monotonic()
+
+    async def _render(self, body):
+        if self._current is None: self._current = await self.channel.send(body)
+        elif body != self._shown: await self._current.edit(content=body)
+        self._shown = body
+
+class RenderRelay:
+    """Mirrors ComfyUI progress into the deferred /imagine response, one edit in flight at a time."""
+    def __init__(self, interaction, interval=PROGRESS_EDIT_INTERVAL):
+        self.interaction = interaction
+        self.interval = interval
+        self._last_edit = 0.0
+        self._task = None
+        self._closed = False
+
+    def update(self, progress):
+        if self._closed or progress.done or (self._task and not self._task.done()): return
+        if time.monotonic() - self._last_edit < self.interval: return
+        self._last_edit = time.monotonic()
+        if progress.max_steps:
+            text = f"🎨 **Rendering** — {progress.node_class} step {progress.step}/{progress.max_steps} ({progress.elapsed:.0f}s)"
+        else:
+            text = f"⚙️ **Rendering** — {progress.node_class or 'starting'} ({progress.elapsed:.0f}s)"
+        self._task = asyncio.create_task(self._edit(text))
+
+    async def _edit(self, text):
+        try: await self.interaction.edit_original_response(content=text)
+        except discord.HTTPException as e: logging.warning(f"Progress edit failed: {e}")
+
+    async def close(self):
+        """Stops relaying and waits out an in-flight edit, so it cannot overwrite the final result."""
+        self._closed = True
+        if self._task: await self._task
 
 # --- INSTANCES ---
-db = PersistenceManager(DB_PATH)
-intel_db = IntelManager(INTEL_DB_PATH)
+# In-memory only; anything touching disk or hardware is opened by start_services(), so importing is side-effect free
+ollama = ollama_client.OllamaClient(OLLAMA_URL, max_concurrent=OLLAMA_MAX_CONCURRENT, request_timeout=OLLAMA_TIMEOUT)
 res_man = ResourceManager()
+context = context_builder.ContextBuilder(CONTEXT_TOKEN_BUDGET)
+metrics_server = metrics.MetricsServer(metrics.registry, METRICS_HOST, METRICS_PORT)
+vision = vision_preprocess.VisionPreprocessor()
+comfy_client.client.timing_listeners.append(observe_render)
+db = news = intel_db = vectors = renders = sampler = None
+
+def start_services():
+    """Opens the chat DB, intel DB, vector index, render cache and telemetry. Called once before bot.run."""
+    global db, news, intel_db, vectors, renders, sampler
+    db = PersistenceManager(DB_PATH)
+    news = news_pipeline.NewsPipeline(INTEL_DB_PATH) # Creates news_history before the reader indexes it
+    intel_db = IntelManager(INTEL_DB_PATH)
+    intel_db.ensure_search_index()
+    vectors = vector_index.VectorIndex(VECTOR_INDEX_PATH, model=EMBED_MODEL)
+    renders = render_cache.RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MAX_MB * 1024**2)
+    sampler = telemetry.TelemetrySampler(TELEMETRY_INTERVAL, TELEMETRY_MINUTES)
 
 # --- SENSORY SYSTEM ---
 def get_system_context(user_name, retrieved_memory=None):
     now = datetime.now().strftime("%H:%M")
-    threats = intel_db.get_latest_threats()
+    threats = intel_db.threats # Cached; chat_job refreshes it off the event loop
 
     memory_block = ""
     if retrieved_memory:
@@ -211,31 +616,221 @@ You are a SENTIENT SYSTEM.
 4. Never mention you are an AI model.
 """
 
+# --- GPU JOBS ---
+def is_image_attachment(attachment):
+    return any(ext in attachment.filename.lower() for ext in IMAGE_EXTS)
+
+async def render_job(request):
+    return await comfy_client.generate_images(request)
+
+async def chat_job(message, msg_content):
+    started = time.perf_counter()
+    async with message.channel.typing():
+        # 1. VISION CHECK (downscaled, cached payloads for every image in the message)
+        image_data = await vision.prepare([a for a in message.attachments if is_image_attachment(a)])
+        active_model = VISION_MODEL if image_data else TEXT_MODEL # Switch to Vision Brain
+
+        # 2. Memory Check (Only if not doing vision, to save complexity)
+        retrieved_memory = None
+        res_man.note_use(active_model)
+        if not image_data:
+            res_man.note_use(EMBED_MODEL)
+            retrieved_memory = await recall(message.content, message.channel.id)
+            if retrieved_memory is None: # Keyword search only stands in when recall could not run; it has no relevance floor
+                retrieved_memory = await asyncio.to_thread(intel_db.search_memory, message.content)
+            retrieved_memory = retrieved_memory or None
+        await intel_db.refresh_threats()
+
+        # 3. Build Payload
+        clean_content = message.content.replace(f"<@{bot.user.id}>", "").strip()
+        if not clean_content and image_data:
+            clean_content = "Analyze this image." # Default prompt for images
+
+        user_msg_payload = {"role": "user", "content": clean_content}
+        if image_data:
+            user_msg_payload["images"] = image_data # Add images to payload
+
+        summary, upto_id = db.get_summary(message.channel.id)
+        history = db.get_recent_context(message.channel.id, limit=db.window, after_id=upto_id) # Older turns live in the summary
+        msgs, dropped = context.build(lambda memory: get_system_context(message.author.display_name, memory), retrieved_memory,
+                                      summary, history, user_msg_payload)
+        if dropped: logging.info(f"Context budget dropped {dropped} turns in channel {message.channel.id}")
+
+        # 4. Generate
+        try:
+            try:
+                if STREAM_REPLIES:
+                    stream = StreamingReply(message.channel)
+                    async for fragment in ollama.chat_stream(active_model, msgs, keep_alive=res_man.keep_alive_for(active_model)):
+                        if not stream.text: CHAT_TTFT.observe(time.perf_counter() - started, model=active_model)
+                        await stream.feed(fragment)
+                    reply = await stream.finish()
+                else:
+                    reply = await ollama.chat(active_model, msgs, keep_alive=res_man.keep_alive_for(active_model))
+                    CHAT_TTFT.observe(time.perf_counter() - started, model=active_model)
+                    await message.channel.send(reply)
+                CHAT_LATENCY.observe(time.perf_counter() - started, model=active_model)
+            except ollama_client.OllamaError as e:
+                logging.error(f"Ollama Error: {e.text}")
+                await message.channel.send("⚠️ **Vision System Failure.**")
+                return
+
+            # Save context (Text only to avoid bloating DB with b64 strings)
+            user_id = db.save_message(message.channel.id, "User", clean_content)
+            db.save_message(message.channel.id, "Clair", reply)
+            await remember_turn(message.channel.id, clean_content, reply)
+            # Everything older than the oldest turn the prompt kept is out of context: fold it into the summary
+            maybe_refresh_summary(message.channel.id, history[dropped]["id"] if dropped < len(history) else user_id)
+        except Exception as e: logging.error(f"Chat Error: {e}")
+
+# --- SEMANTIC MEMORY ---
+async def recall(query, channel_id):
+    """Top-k intel and past-conversation hits for a message: "" if nothing scored above the floor,
+    None if recall was skipped (empty index, timeout or embedding error)."""
+    async def search():
+        vec = (await ollama.embed(EMBED_MODEL, [query], keep_alive=res_man.keep_alive_for(EMBED_MODEL)))[0]
+        def run():
+            intel = vectors.search(vec, RETRIEVAL_TOP_K, kind="intel", min_score=RETRIEVAL_MIN_SCORE)
+            chat = vectors.search(vec, RETRIEVAL_TOP_K, kind="chat", channel=channel_id, min_score=RETRIEVAL_MIN_SCORE)
+            return intel, chat
+        return await asyncio.to_thread(run)
+    if not query.strip(): return ""
+    if not len(vectors): return None
+    try:
+        intel, chat = await asyncio.wait_for(search(), RETRIEVAL_BUDGET)
+    except (asyncio.TimeoutError, aiohttp.ClientError, ollama_client.OllamaError) as e:
+        logging.info(f"Semantic recall skipped: {e.__class__.__name__}")
+        return None
+    context = ""
+    if intel:
+        context += "RELEVANT INTEL FOUND IN MEMORY:\n"
+        for _, m in intel: context += f"- [{m['source']}] {m['headline']}: {m['summary'] or 'No summary available.'}\n"
+    if chat:
+        context += "RELATED PAST CONVERSATION:\n"
+        for _, m in chat: context += f"- {m['text']}\n"
+    return context
+
+async def remember_turn(channel_id, user_text, reply):
+    text = f"User: {user_text}\nClair: {reply}"
+    try:
+        vec = await ollama.embed(EMBED_MODEL, [text[:2000]], keep_alive=res_man.keep_alive_for(EMBED_MODEL))
+        await asyncio.to_thread(vectors.add, vec, [{"kind": "chat", "channel": channel_id, "text": text[:500]}])
+    except (aiohttp.ClientError, asyncio.TimeoutError, ollama_client.OllamaError) as e:
+        logging.warning(f"Chat embedding failed: {e}")
+
+async def index_new_intel(batch=INTEL_INDEX_BATCH):
+    """Embeds one batch of news_history rows added since the last pass (rowid is append-only); returns the row count."""
+    rows = await asyncio.to_thread(intel_db.get_rows_after, vectors.last_ref("intel"), batch)
+    if not rows: return 0
+    texts = [f"{r[1]}. {r[3] or ''}" for r in rows]
+    vecs = await ollama.embed(EMBED_MODEL, texts, keep_alive=res_man.keep_alive_for(EMBED_MODEL))
+    metas = [{"kind": "intel", "ref": r[0], "headline": r[1], "source": r[2], "summary": r[3]} for r in rows]
+    await asyncio.to_thread(vectors.add, vecs, metas)
+    logging.info(f"Indexed {len(rows)} intel rows ({len(vectors)} vectors)")
+    return len(rows)
+
+async def intel_index_loop():
+    # One batch per GPU job so a backlog never holds the scheduler; the next batch re-queues only while it stays idle
+    backlog = True
+    while True:
+        sched = res_man.scheduler
+        if not sched.pending() and sched.mode != gpu_scheduler.IMAGE: # Embedding loads a model, so never during renders
+            try: backlog = await sched.run(gpu_scheduler.CHAT, index_new_intel) >= INTEL_INDEX_BATCH
+            except Exception as e:
+                logging.warning(f"Intel indexing failed: {e}")
+                backlog = False
+            if backlog:
+                await asyncio.sleep(0)
+                continue
+        await asyncio.sleep(IDLE_HANDOFF_DELAY if backlog else INTEL_INDEX_INTERVAL)
+
+summary_tasks = {}
+intel_indexer = None
+news_scanner = None
+telemetry_task = None
+
+def maybe_refresh_summary(channel_id, keep_from):
+    """Folds turns older than `keep_from` into the rolling summary, only when the GPU has nothing else to do."""
+    sched = res_man.scheduler
+    if not db.summary_due(channel_id) or channel_id in summary_tasks: return
+    if sched.pending() or sched.mode == gpu_scheduler.IMAGE: return
+    future, _ = res_man.submit(gpu_scheduler.CHAT, refresh_summary, channel_id, keep_from)
+    summary_tasks[channel_id] = future
+    future.add_done_callback(lambda f: summary_done(channel_id, f))
+
+def summary_done(channel_id, future):
+    summary_tasks.pop(channel_id, None)
+    if not future.cancelled() and future.exception(): logging.warning(f"Summary Job Error: {future.exception()}")
+
+async def refresh_summary(channel_id, keep_from):
+    summary, upto_id = db.get_summary(channel_id)
+    await asyncio.to_thread(db.flush)
+    rows = await asyncio.to_thread(db.get_unsummarized, channel_id, upto_id, keep_from, SUMMARY_BATCH)
+    if not rows: return
+    transcript = "\n".join(f"{'Clair' if r[1] == 'Clair' else 'User'}: {r[2]}" for r in rows)
+    prompt = f"Previous summary:\n{summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+    msgs = [{"role": "system", "content": "Merge the previous summary and the new turns into one updated summary of the conversation. Keep names, facts, decisions and open questions. Max 150 words."},
+            {"role": "user", "content": prompt}]
+    try:
+        new_summary = await ollama.chat(TEXT_MODEL, msgs, keep_alive=res_man.keep_alive_for(TEXT_MODEL))
+    except ollama_client.OllamaError as e:
+        logging.warning(f"Summary refresh failed for {channel_id}: {e}")
+        return
+    await asyncio.to_thread(db.save_summary, channel_id, new_summary.strip(), rows[-1][0])
+
 # --- EVENTS ---
+async def install_shutdown_handler():
+    # docker stop sends SIGTERM: close the bot cleanly so bot.run returns and __main__ drains the chat DB
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+bot.setup_hook = install_shutdown_handler
+
 @bot.event
 async def on_ready():
     logging.info(f'Logged in as {bot.user}')
+    global intel_indexer, news_scanner, telemetry_task
+    if intel_indexer is None or intel_indexer.done(): intel_indexer = asyncio.create_task(intel_index_loop())
+    if news_scanner is None or news_scanner.done(): news_scanner = asyncio.create_task(news.run_forever(NEWS_INTERVAL))
+    if telemetry_task is None or telemetry_task.done(): telemetry_task = asyncio.create_task(sampler.run_forever())
+    await metrics_server.start()
+    if res_man.scheduler.mode is None: res_man.preload(res_man.expected_models()) # Warm the chat models before the first message
     try: await bot.tree.sync()
     except: pass
 
-@bot.tree.command(name="imagine", description="Generate an image using Flux")
-async def imagine(interaction: discord.Interaction, prompt: str, aspect_ratio: app_commands.Choice[str] = None, negative_prompt: str = ""):
+@bot.tree.command(name="imagine", description="Generate an image (Lightning = fast, Flux = quality)")
+@app_commands.choices(
+    aspect_ratio=[app_commands.Choice(name=ar, value=ar) for ar in workflow_templates.ASPECT_RATIOS],
+    engine=[app_commands.Choice(name="Lightning (fast)", value="lightning"), app_commands.Choice(name="Flux (quality)", value="flux")],
+)
+async def imagine(interaction: discord.Interaction, prompt: str, aspect_ratio: app_commands.Choice[str] = None, negative_prompt: str = "",
+                  seed: int = None, engine: app_commands.Choice[str] = None):
     if any(bad in prompt.lower() for bad in BLOCKED_TERMS):
         await interaction.response.send_message("⛔ **Safety Violation.**", ephemeral=True)
         return
-    if res_man.gpu_locked:
-        await interaction.response.send_message("⏳ **System Busy.**", ephemeral=True)
-        return
     await interaction.response.defer(thinking=True)
     ar_val = aspect_ratio.value if aspect_ratio else "1:1"
-    await res_man.engage_gpu_mode()
+    positive, negative = f"{prompt}, masterpiece", f"nsfw, {negative_prompt}"
+    if seed is None and DETERMINISTIC_RENDERS: seed = render_cache.derive_seed(positive, negative)
+    width, height = workflow_templates.resolution_for(ar_val)
+    template = engine.value if engine else workflow_templates.DEFAULT_TEMPLATE
+    relay = RenderRelay(interaction)
+    request = comfy_client.RenderRequest(positive, negative, width, height, seed=seed, template=template, on_progress=relay.update)
     try:
-        img_bytes = await asyncio.to_thread(comfy_client.generate_image, f"{prompt}, masterpiece", f"nsfw, {negative_prompt}")
-        if img_bytes:
-            await interaction.followup.send(content=f"**Prompt:** {prompt} | **AR:** {ar_val}", file=discord.File(io.BytesIO(img_bytes), "render.png"))
+        try:
+            # Cache hits never touch the scheduler, VRAM or ComfyUI
+            images = await renders.get(request)
+            cached = images is not None
+            if not cached:
+                future, position = res_man.submit(gpu_scheduler.IMAGE, render_job, request)
+                if position: await interaction.edit_original_response(content=f"⏳ **Queued** — position {position}")
+                images = await future
+                await renders.put(request, images)
+        finally: await relay.close()
+        if images:
+            files = [discord.File(io.BytesIO(img), f"render_{i}.png") for i, img in enumerate(images)]
+            tag = " | ♻️ cached" if cached else ""
+            await interaction.followup.send(content=f"**Prompt:** {prompt} | **AR:** {ar_val} ({width}x{height}) | **Engine:** {template}{tag}", files=files)
         else: await interaction.followup.send("❌ **Render Error**")
     except Exception as e: await interaction.followup.send(f"❌ **Error:** {str(e)}")
-    finally: await res_man.engage_chat_mode()
 
 # --- CHAT LISTENER ---
 @bot.event
@@ -253,66 +848,28 @@ async def on_message(message):
     # Reactions
     for k, v in REACTION_MAP.items():
         if k in msg_content: await message.add_reaction(v); break
-    if res_man.gpu_locked:
-        if bot.user in message.mentions: await message.add_reaction(random.choice(BUSY_EMOJIS))
-        return
 
-    async with message.channel.typing():
-        # 1. VISION CHECK
-        image_data = None
-        active_model = TEXT_MODEL
-
-        if message.attachments:
-            for attachment in message.attachments:
-                if any(ext in attachment.filename.lower() for ext in ['png', 'jpg', 'jpeg', 'webp']):
-                    # Download and encode image
-                    try:
-                        img_bytes = await attachment.read()
-                        image_data = base64.b64encode(img_bytes).decode('utf-8')
-                        active_model = VISION_MODEL # Switch to Vision Brain
-                        break # Only process first image for now
-                    except Exception as e:
-                        logging.error(f"Image Load Error: {e}")
+    mode = gpu_scheduler.VISION if any(is_image_attachment(a) for a in message.attachments) else gpu_scheduler.CHAT
+    future, position = res_man.submit(mode, chat_job, message, msg_content)
+    if position:
+        busy = random.choice(BUSY_EMOJIS) if res_man.gpu_locked else "⏳"
+        await message.reply(f"{busy} **Queued** — position {position}", mention_author=False)
+    try: await future
+    except Exception as e: logging.error(f"Chat Job Error: {e}")
 
-        # 2. Memory Check (Only if not doing vision, to save complexity)
-        retrieved_memory = None
-        if not image_data and any(x in msg_content for x in ["news", "latest", "update", "happened", "linux", "exploit", "intel"]):
-            retrieved_memory = intel_db.search_memory(message.content)
-
-        # 3. Build Payload
-        sys_prompt = get_system_context(message.author.display_name, retrieved_memory)
-        msgs = [{"role": "system", "content": sys_prompt}] + db.get_recent_context(message.channel.id)
-
-        clean_content = message.content.replace(f"<@{bot.user.id}>", "").strip()
-        if not clean_content and image_data:
-            clean_content = "Analyze this image." # Default prompt for images
-
-        user_msg_payload = {"role": "user", "content": clean_content}
-        if image_data:
-            user_msg_payload["images"] = [image_data] # Add image to payload
-
-        msgs.append(user_msg_payload)
-
-        # 4. Generate
-        try:
-            r = requests.post(OLLAMA_CHAT_URL, json={"model": active_model, "messages": msgs, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE})
-            if r.status_code != 200:
-                logging.error(f"Ollama Error: {r.text}")
-                await message.channel.send("⚠️ **Vision System Failure.**")
-                return
-
-            reply = r.json()['message']['content']
-
-            # Save context (Text only to avoid bloating DB with b64 strings)
-            db.save_message(message.channel.id, "User", clean_content)
-            db.save_message(message.channel.id, "Clair", reply)
-            await message.channel.send(reply)
-        except Exception as e: logging.error(f"Chat Error: {e}")
 
 @bot.command()
 async def restart(ctx):
     if str(ctx.author.id) == OWNER_ID:
         await ctx.send("👋 **Rebooting...**")
+        await ollama.close()
+        await comfy_client.close()
+        await news.close()
+        await metrics_server.stop()
+        await asyncio.to_thread(db.flush)
         await bot.close()
 
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    start_services()
+    try: bot.run(DISCORD_TOKEN)
+    finally: db.close() # Drain the write-behind queue and checkpoint the WAL on any exit from the event loop
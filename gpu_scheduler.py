@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+# GPU modes, in dispatch priority order (chat is the most latency sensitive)
+CHAT = "chat"
+VISION = "vision"
+IMAGE = "image"
+PRIORITY = (CHAT, VISION, IMAGE)
+
+# Jobs of one mode that may share the GPU at once (Ollama serves parallel chats, ComfyUI renders one by one)
+DEFAULT_CONCURRENCY = {CHAT: 4, VISION: 2, IMAGE: 1}
+# Jobs dispatched in one mode before a waiting mode gets its turn (bounds starvation)
+DEFAULT_MAX_BATCH = {CHAT: 8, VISION: 4, IMAGE: 4}
+# Seconds the GPU must sit idle in another mode before it is handed back to `idle_mode`
+IDLE_HANDOFF_DELAY = 5.0
+
+class GpuJob:
+    def __init__(self, mode, fn, args):
+        self.mode = mode
+        self.fn = fn
+        self.args = args
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.monotonic()
+
+class GpuScheduler:
+    """Single owner of the GPU: queues jobs per mode and batches them to minimise VRAM swaps.
+
+    `on_switch(old_mode, new_mode)` is awaited with no job running whenever the GPU changes
+    hands, so callers put their unload/load logic there and never touch the GPU directly.
+    With `idle_mode` set, an idle GPU is handed back to that mode after `idle_delay` seconds,
+    so its models are warm before the next job of that mode arrives.
+    """
+    def __init__(self, on_switch, concurrency=None, max_batch=None, idle_mode=None, idle_delay=IDLE_HANDOFF_DELAY):
+        self.on_switch = on_switch
+        self.idle_mode = idle_mode
+        self.idle_delay = idle_delay
+        self.concurrency = dict(DEFAULT_CONCURRENCY, **(concurrency or {}))
+        self.max_batch = dict(DEFAULT_MAX_BATCH, **(max_batch or {}))
+        self.queues = {m: deque() for m in PRIORITY}
+        self.mode = None
+        self.running = 0
+        self.batch = 0 # Jobs dispatched since the last switch
+        self.switches = 0
+        self.switch_counts = {}
+        self.switch_seconds = 0.0
+        self._switch_target = None # Mode we are draining the GPU for
+        self._wake = asyncio.Event()
+        self._worker = None
+        self._tasks = set() # Strong refs so running jobs are not garbage collected
+
+    # --- PUBLIC API ---
+    def submit(self, mode, fn, *args):
+        """Queues `fn(*args)` (a coroutine function) and returns (future, position).
+
+        Position is 0 when the job can start right away, otherwise its 1-based place in line.
+        """
+        if mode not in self.queues: raise ValueError(f"Unknown GPU mode: {mode}")
+        self._ensure_worker()
+        position = self._position(mode)
+        job = GpuJob(mode, fn, args)
+        self.queues[mode].append(job)
+        self._wake.set()
+        return job.future, position
+
+    async def run(self, mode, fn, *args):
+        future, _ = self.submit(mode, fn, *args)
+        return await future
+
+    def upcoming(self):
+        """Modes of the queued jobs in the order they will get the GPU (current mode first)."""
+        order = []
+        for m in self._dispatch_order():
+            if m not in order: order.append(m)
+        return order
+
+    def pending(self, mode=None):
+        if mode: return len(self.queues[mode])
+        return sum(len(q) for q in self.queues.values())
+
+    def stats(self):
+        return {
+            "mode": self.mode, "running": self.running,
+            "queued": {m: len(q) for m, q in self.queues.items()},
+            "switches": self.switches, "switch_seconds": round(self.switch_seconds, 2),
+            "switch_counts": dict(self.switch_counts),
+        }
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            try: await self._worker
+            except asyncio.CancelledError: pass
+        self._worker = None
+
+    # --- INTERNALS ---
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def _position(self, mode):
+        # Replay the dispatcher over the queues plus this job: it starts at once if it lands in the
+        # current batch with a free slot, otherwise its place is the number of jobs dispatched first + 1
+        counts = {m: len(q) for m, q in self.queues.items()}
+        counts[mode] += 1
+        ahead, switched, current = 0, False, self.mode
+        for m in self._dispatch_order(counts):
+            if m != current:
+                switched = switched or current is not None
+                current = m
+            if m == mode:
+                counts[mode] -= 1
+                if counts[mode] == 0: break # Queues are FIFO, so the last job of our mode is ours
+            ahead += 1
+        if not switched and self.running + ahead < self.concurrency[mode]: return 0
+        return ahead + 1
+
+    def _dispatch_order(self, counts=None):
+        """Yields the mode of each queued job in the order `_run` will dispatch them."""
+        counts = dict(counts or {m: len(q) for m, q in self.queues.items()})
+        mode, batch, target = self.mode, self.batch, self._switch_target
+        while True:
+            m = self._pick(mode, batch, target, counts)
+            if m is None: return
+            if m != mode: mode, batch, target = m, 0, None
+            counts[m] -= 1
+            batch += 1
+            yield m
+
+    def _pick(self, mode, batch, target, counts):
+        if target and counts[target]: return target
+        if mode and counts[mode] and batch < self.max_batch[mode]:
+            return mode
+        for m in PRIORITY:
+            if counts[m] and m != mode: return m
+        return mode if mode and counts[mode] else None
+
+    def _next_mode(self):
+        return self._pick(self.mode, self.batch, self._switch_target, {m: len(q) for m, q in self.queues.items()})
+
+    async def _run(self):
+        while True:
+            mode = self._next_mode()
+            if mode is None or (mode == self.mode and self.running >= self.concurrency[mode]):
+                self._wake.clear()
+                if mode is None and not self.running and self.idle_mode and self.mode not in (None, self.idle_mode):
+                    try: await asyncio.wait_for(self._wake.wait(), self.idle_delay)
+                    except asyncio.TimeoutError: await self._switch(self.idle_mode)
+                else:
+                    await self._wake.wait()
+                continue
+            if mode != self.mode:
+                if self.running:
+                    self._switch_target = mode # Stop dispatching the old mode, wait for it to drain
+                    self._wake.clear()
+                    await self._wake.wait()
+                    continue
+                await self._switch(mode)
+                continue
+            job = self.queues[mode].popleft()
+            self.running += 1
+            self.batch += 1
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _switch(self, mode):
+        old, start = self.mode, time.monotonic()
+        try: await self.on_switch(old, mode)
+        except Exception as e: logging.error(f"GPU mode switch {old} -> {mode} failed: {e}")
+        elapsed = time.monotonic() - start
+        self.mode, self.batch, self._switch_target = mode, 0, None
+        if old is not None:
+            self.switches += 1
+            self.switch_seconds += elapsed
+            key = f"{old}->{mode}"
+            self.switch_counts[key] = self.switch_counts.get(key, 0) + 1
+        logging.info(f"GPU mode {old} -> {mode} ({elapsed:.2f}s, {self.pending()} queued)")
+
+    async def _execute(self, job):
+        try:
+            result = await job.fn(*job.args)
+            if not job.future.done(): job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done(): job.future.set_exception(e)
+        finally:
+            self.running -= 1
+            self._wake.set()
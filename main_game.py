@@ -1,8 +1,13 @@
+import logging
+import random
+from collections import deque
+import numpy as np
+import pygame
+
 class Enemy(pygame.sprite.Sprite):
     def __init__(self, color, x, y, size, speed, player, world):
         super().__init__()
-        self.image = pygame.Surface([size, size])
-        self.image.fill(color)
+        self.image = shared_surface(color, size)
         self.rect = self.image.get_rect()
         self.rect.x = x
         self.rect.y = y
@@ -11,17 +16,11 @@ class Enemy(pygame.sprite.Sprite):
         self.world = world
 
     def update(self):
-        # Basic AI: Move towards the player
-        dx, dy = 0, 0
-        if self.rect.centerx < self.player.rect.centerx:
-            dx = self.speed
-        elif self.rect.centerx > self.player.rect.centerx:
-            dx = -self.speed
-
-        if self.rect.centery < self.player.rect.centery:
-            dy = self.speed
-        elif self.rect.centery > self.player.rect.centery:
-            dy = -self.speed
+        # Follow the shared flow field to the next cell; head straight for the player when in
+        # the player's cell or outside the field
+        target_x, target_y = self.world.flow.next_waypoint(self.rect.centerx, self.rect.centery) or self.player.rect.center
+        dx = max(-self.speed, min(self.speed, target_x - self.rect.centerx))
+        dy = max(-self.speed, min(self.speed, target_y - self.rect.centery))
 
         # Attempt to move and check for collisions with world tiles
         self.move_and_collide(dx, dy)
@@ -48,23 +47,39 @@ class Enemy(pygame.sprite.Sprite):
         self.rect.y = max(0, min(self.rect.y, screen_height - self.rect.height))
 
 
+# Surfaces shared by every entity with the same look: (color, size) -> Surface
+_surface_cache = {}
+
+def shared_surface(color, size):
+    surface = _surface_cache.get((color, size))
+    if surface is None:
+        surface = _surface_cache[(color, size)] = pygame.Surface([size, size])
+        surface.fill(color)
+    return surface
+
 class Grenade(pygame.sprite.Sprite):
     def __init__(self, color, x, y, size, speed, direction, world, explosion_radius, explosion_damage, detonation_timer):
         super().__init__()
-        self.image = pygame.Surface([size, size])
-        self.image.fill(color)
+        self.image = shared_surface(color, size)
         self.rect = self.image.get_rect()
+        self.world = world
+        self.explosion_radius = explosion_radius
+        self.explosion_damage = explosion_damage # Not used yet, but for future enemy damage
+        self.detonation_timer = detonation_timer
+        self.pool = None # Set by EntityPool for pooled grenades
+        self.slot = None
+        self.reset(x, y, speed, direction)
+
+    def reset(self, x, y, speed, direction):
         self.rect.x = x
         self.rect.y = y
         self.speed = speed
         self.direction = direction
-        self.world = world
-        self.explosion_radius = explosion_radius
-        self.explosion_damage = explosion_damage # Not used yet, but for future enemy damage
-        self.detonation_time = pygame.time.get_ticks() + detonation_timer
+        self.detonation_time = pygame.time.get_ticks() + self.detonation_timer
         self.is_exploding = False
 
     def update(self):
+        # Per-object path for unpooled grenades; pooled ones move in EntityPool.update and land in step()
         if not self.is_exploding:
             self.rect.x += self.direction[0] * self.speed
             self.rect.y += self.direction[1] * self.speed
@@ -77,8 +92,7 @@ class Grenade(pygame.sprite.Sprite):
                 return
 
             # Check for collision with tiles
-            collided_tile = self.world.get_tile_at_position(self.rect.centerx, self.rect.centery)
-            if collided_tile and collided_tile.is_destructible and not collided_tile.is_destroyed:
+            if self.hits_tile():
                 self.is_exploding = True
                 self.detonation_time = pygame.time.get_ticks() # Detonate immediately on tile hit
 
@@ -88,6 +102,17 @@ class Grenade(pygame.sprite.Sprite):
             self.detonate()
             self.kill() # Grenade is removed after detonation
 
+    def step(self, offscreen, expired):
+        if offscreen:
+            self.kill()
+        elif expired or self.hits_tile():
+            self.detonate()
+            self.kill()
+
+    def hits_tile(self):
+        collided_tile = self.world.get_tile_at_position(self.rect.centerx, self.rect.centery)
+        return bool(collided_tile and collided_tile.is_destructible and not collided_tile.is_destroyed)
+
     def detonate(self):
         # Destroy tiles within the explosion radius
         for r in range(int(self.rect.centery - self.explosion_radius), int(self.rect.centery + self.explosion_radius), self.world.tile_size):
@@ -95,21 +120,30 @@ class Grenade(pygame.sprite.Sprite):
                 self.world.destroy_tile_at_position(c, r)
         # TODO: Add visual explosion effect here
 
+    def kill(self):
+        super().kill()
+        if self.pool: self.pool.release(self.slot)
+
 class Projectile(pygame.sprite.Sprite):
     def __init__(self, color, x, y, size, speed, direction, world):
         super().__init__()
-        self.image = pygame.Surface([size, size])
-        self.image.fill(color)
+        self.image = shared_surface(color, size)
         self.rect = self.image.get_rect()
+        self.world = world  # Reference to the world object for collision detection
+        self.lifespan = 1000 # Projectile disappears after 1 second (1000 milliseconds)
+        self.pool = None # Set by EntityPool for pooled projectiles
+        self.slot = None
+        self.reset(x, y, speed, direction)
+
+    def reset(self, x, y, speed, direction):
         self.rect.x = x
         self.rect.y = y
         self.speed = speed
         self.direction = direction
-        self.world = world  # Reference to the world object for collision detection
         self.spawn_time = pygame.time.get_ticks()
-        self.lifespan = 1000 # Projectile disappears after 1 second (1000 milliseconds)
 
     def update(self):
+        # Per-object path for unpooled projectiles; pooled ones move in EntityPool.update and land in step()
         self.rect.x += self.direction[0] * self.speed
         self.rect.y += self.direction[1] * self.speed
 
@@ -120,75 +154,344 @@ class Projectile(pygame.sprite.Sprite):
             self.rect.bottom < 0 or self.rect.top > screen_height or
             pygame.time.get_ticks() - self.spawn_time > self.lifespan):
             self.kill()
+            return
+
+        self.hit_tiles()
+
+    def step(self, offscreen, expired):
+        if offscreen or expired:
+            self.kill()
+        else:
+            self.hit_tiles()
 
+    def hit_tiles(self):
         # Check for collision with tiles
         collided_tile = self.world.get_tile_at_position(self.rect.centerx, self.rect.centery)
         if collided_tile and collided_tile.is_destructible and not collided_tile.is_destroyed:
             collided_tile.destroy()
             self.kill() # Projectile is destroyed on impact
 
+    def kill(self):
+        super().kill()
+        if self.pool: self.pool.release(self.slot)
+
+class EntityPool:
+    """Fixed-capacity pool of reusable sprites with array-backed positions.
+
+    Positions, velocities and expiry ticks live in NumPy arrays, so a frame's movement, off-screen /
+    lifetime culling and the tile-hit test are a few vector ops. Sprites are only touched to copy
+    back their rect, and step() only runs for the ones that hit or expire; killing a pooled sprite
+    returns its slot.
+    """
+    def __init__(self, factory, capacity, world, *groups):
+        self.capacity = capacity
+        self.world = world
+        self.groups = groups
+        self.pos = np.zeros((capacity, 2), np.float64)
+        self.vel = np.zeros((capacity, 2), np.float64)
+        self.expires = np.zeros(capacity, np.int64)
+        self.alive = np.zeros(capacity, bool)
+        self.free = list(range(capacity - 1, -1, -1)) # Stack of free slots, lowest on top
+        self.sprites = []
+        for slot in range(capacity):
+            sprite = factory()
+            sprite.pool, sprite.slot = self, slot
+            self.sprites.append(sprite)
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def spawn(self, x, y, speed, direction, lifetime):
+        """Activates a free sprite; returns it, or None when the pool is exhausted."""
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        sprite = self.sprites[slot]
+        sprite.reset(x, y, speed, direction)
+        self.pos[slot] = (x, y)
+        self.vel[slot] = (direction[0] * speed, direction[1] * speed)
+        self.expires[slot] = pygame.time.get_ticks() + lifetime
+        self.alive[slot] = True
+        sprite.add(*self.groups)
+        return sprite
+
+    def release(self, slot):
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.free.append(slot)
+
+    def update(self, width, height):
+        slots = np.flatnonzero(self.alive)
+        if not slots.size:
+            return
+        self.pos[slots] += self.vel[slots]
+        pos = self.pos[slots]
+        size = self.sprites[slots[0]].rect.width # Pools hold one kind of sprite
+        offscreen = (pos[:, 0] + size < 0) | (pos[:, 0] > width) | (pos[:, 1] + size < 0) | (pos[:, 1] > height)
+        expired = self.expires[slots] <= pygame.time.get_ticks()
+        corner = pos.astype(np.int64)
+        center = (corner + size // 2) // self.world.tile_size
+        hit = self.world.map.codes_at(center[:, 1], center[:, 0]) == DESTRUCTIBLE
+        for slot, (x, y) in zip(slots.tolist(), corner.tolist()):
+            rect = self.sprites[slot].rect
+            rect.x = x
+            rect.y = y
+        events = offscreen | expired | hit
+        for slot, off, exp in zip(slots[events].tolist(), offscreen[events].tolist(), expired[events].tolist()):
+            self.sprites[slot].step(off, exp)
+
+# Cell codes stored in the tile map (one byte per cell)
+SOLID, DESTRUCTIBLE, DESTROYED = 0, 1, 2
+OUTSIDE = 255 # Returned by TileMap.codes_at for cells off the map
+TILE_COLORS = {SOLID: (128, 128, 128), DESTRUCTIBLE: (0, 128, 0)} # Grey walls, green destructible tiles
+BACKGROUND_COLOR = (30, 30, 30) # Dark grey, shows through destroyed cells
+CHUNK_SIZE = 64 # Cells per chunk side
+STREAM_RADIUS = 2 # Chunks kept loaded around the focus point
+
+class TileMap:
+    """Chunked tile storage: one bytearray of cell codes per CHUNK_SIZE x CHUNK_SIZE chunk.
+
+    Chunks are generated on first access from (seed, chunk row, chunk col), so an unloaded chunk
+    comes back identical; chunks with destroyed cells stay resident so no damage is lost.
+    """
+    def __init__(self, rows, cols, density=0.5, seed=None, chunk_size=CHUNK_SIZE):
+        self.rows = rows
+        self.cols = cols
+        self.density = density
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.chunk_size = chunk_size
+        self.chunks = {} # (chunk_row, chunk_col) -> bytearray
+        self.dirty = set() # Chunks with destroyed cells
+
+    def _generate_chunk(self, cr, cc):
+        n = self.chunk_size
+        rng = np.random.default_rng((self.seed, cr, cc))
+        r = np.arange(cr * n, cr * n + n)[:, None]
+        c = np.arange(cc * n, cc * n + n)[None, :]
+        border = (r == 0) | (r == self.rows - 1) | (c == 0) | (c == self.cols - 1)
+        cells = np.where(border | (rng.random((n, n)) < self.density), DESTRUCTIBLE, SOLID).astype(np.uint8)
+        return bytearray(cells.tobytes())
+
+    def chunk(self, cr, cc):
+        key = (cr, cc)
+        data = self.chunks.get(key)
+        if data is None:
+            data = self.chunks[key] = self._generate_chunk(cr, cc)
+        return data
+
+    def get(self, row, col):
+        """Cell code, or None outside the map."""
+        if row < 0 or col < 0 or row >= self.rows or col >= self.cols:
+            return None
+        n = self.chunk_size
+        return self.chunk(row // n, col // n)[(row % n) * n + col % n]
+
+    def codes_at(self, rows, cols):
+        """Vectorised get() for integer arrays of cells; OUTSIDE where off the map."""
+        codes = np.full(rows.shape, OUTSIDE, np.uint8)
+        inside = (rows >= 0) & (cols >= 0) & (rows < self.rows) & (cols < self.cols)
+        n = self.chunk_size
+        r, c = rows[inside], cols[inside]
+        cr, cc = r // n, c // n
+        values = np.empty(r.shape, np.uint8)
+        for key in set(zip(cr.tolist(), cc.tolist())): # Entities cluster, so only a few chunks
+            sel = (cr == key[0]) & (cc == key[1])
+            cells = np.frombuffer(self.chunk(*key), np.uint8).reshape(n, n)
+            values[sel] = cells[r[sel] % n, c[sel] % n]
+        codes[inside] = values
+        return codes
+
+    def set(self, row, col, code):
+        n = self.chunk_size
+        self.chunk(row // n, col // n)[(row % n) * n + col % n] = code
+        self.dirty.add((row // n, col // n))
+
+    def stream(self, row, col, radius=STREAM_RADIUS):
+        """Loads the chunks within `radius` of a cell and drops clean chunks further away."""
+        n = self.chunk_size
+        cr, cc = row // n, col // n
+        for key in [k for k in self.chunks if max(abs(k[0] - cr), abs(k[1] - cc)) > radius and k not in self.dirty]:
+            del self.chunks[key]
+        for r in range(max(0, cr - radius), min((self.rows - 1) // n, cr + radius) + 1):
+            for c in range(max(0, cc - radius), min((self.cols - 1) // n, cc + radius) + 1):
+                self.chunk(r, c)
+
 class World:
-    def __init__(self, screen_width, screen_height, tile_size):
+    def __init__(self, screen_width, screen_height, tile_size, chunk_size=CHUNK_SIZE):
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.tile_size = tile_size
-        self.tiles = pygame.sprite.Group()
-        self.map_data = []
-
-    def generate_map(self, density=0.5):
-        # Simple grid generation with some destructible tiles
-        rows = self.screen_height // self.tile_size
-        cols = self.screen_width // self.tile_size
-        
-        for r in range(rows):
-            row_data = []
-            for c in range(cols):
-                x = c * self.tile_size
-                y = r * self.tile_size
-                if (r == 0 or r == rows - 1 or c == 0 or c == cols - 1) or (random.random() < density):
-                    # Border tiles and some inner tiles are destructible
-                    tile = Tile((0, 128, 0), x, y, self.tile_size, is_destructible=True) # Green destructible tiles
-                    row_data.append(tile)
-                    self.tiles.add(tile)
-                else:
-                    # Non-destructible tiles (e.g., walls)
-                    tile = Tile((128, 128, 128), x, y, self.tile_size, is_destructible=False) # Grey non-destructible tiles
-                    row_data.append(tile)
-                    self.tiles.add(tile)
-            self.map_data.append(row_data)
+        self.chunk_size = chunk_size
+        self.map = None # TileMap; also the spatial index for lookups
+        self.rows = 0
+        self.cols = 0
+        self.background = None # Pre-rendered tile layer for the screen area
+        self.dirty_rects = [] # Background areas repainted since the last pop_dirty()
+        self.version = 0 # Bumped whenever a cell changes, so derived data (the flow field) knows to rebuild
+        self.flow = FlowField(self)
+        # Only two tile types, so every cell shares one surface per type
+        self.tile_images = {}
+        for code, color in TILE_COLORS.items():
+            self.tile_images[code] = pygame.Surface([tile_size, tile_size])
+            self.tile_images[code].fill(color)
+
+    def generate_map(self, density=0.5, rows=None, cols=None, seed=None):
+        # Border tiles and some inner tiles are destructible; chunks are generated lazily (defaults to one screen of tiles)
+        self.rows = rows or self.screen_height // self.tile_size
+        self.cols = cols or self.screen_width // self.tile_size
+        self.map = TileMap(self.rows, self.cols, density, seed, self.chunk_size)
+        self.version += 1
+        self.stream_around(self.screen_width // 2, self.screen_height // 2)
+        self.render_background()
+
+    def stream_around(self, x, y, radius=STREAM_RADIUS):
+        self.map.stream(int(y) // self.tile_size, int(x) // self.tile_size, radius)
+
+    def render_background(self):
+        # Paint the tile layer once; destroy_cell patches single cells from then on
+        self.background = pygame.Surface((self.screen_width, self.screen_height))
+        if pygame.display.get_surface():
+            self.background = self.background.convert() # Match the display format so blits are plain copies
+        self.background.fill(BACKGROUND_COLOR)
+        rows = range(0, min(self.rows, -(-self.screen_height // self.tile_size)))
+        cols = range(0, min(self.cols, -(-self.screen_width // self.tile_size)))
+        self.background.blits([(self.tile_images[code], (c * self.tile_size, r * self.tile_size))
+                               for r in rows for c in cols if (code := self.map.get(r, c)) != DESTROYED], doreturn=False)
+        self.dirty_rects = [self.background.get_rect()]
 
     def draw(self, screen):
-        self.tiles.draw(screen)
+        # Full redraw; the game loop only pushes pop_dirty() areas
+        screen.blit(self.background, (0, 0))
+
+    def pop_dirty(self):
+        rects, self.dirty_rects = self.dirty_rects, []
+        return rects
 
     def get_tile_at_position(self, x, y):
-        # More accurate collision check: iterate through tiles and check rect collision
-        for tile in self.tiles:
-            if tile.rect.collidepoint(x, y):
-                return tile
-        return None
+        # O(1) grid lookup: tiles sit on a fixed grid, so integer division finds the cell
+        if x < 0 or y < 0:
+            return None
+        row = int(y) // self.tile_size
+        col = int(x) // self.tile_size
+        code = self.map.get(row, col)
+        if code is None or code == DESTROYED:
+            return None
+        return Tile(self, row, col, code)
 
     def destroy_tile_at_position(self, x, y):
         tile = self.get_tile_at_position(x, y)
         if tile:
             tile.destroy()
 
+    def destroy_cell(self, row, col):
+        if self.map.get(row, col) == DESTRUCTIBLE:
+            self.map.set(row, col, DESTROYED)
+            self.version += 1
+            rect = pygame.Rect(col * self.tile_size, row * self.tile_size, self.tile_size, self.tile_size)
+            if self.background and self.background.get_rect().colliderect(rect):
+                self.background.fill(BACKGROUND_COLOR, rect)
+                self.dirty_rects.append(rect)
 
-# Tile class definition (already present)
-class Tile(pygame.sprite.Sprite):
-    def __init__(self, color, x, y, size, is_destructible=True):
-        super().__init__()
-        self.image = pygame.Surface([size, size])
-        self.image.fill(color)
-        self.rect = self.image.get_rect()
-        self.rect.x = x
-        self.rect.y = y
-        self.is_destructible = is_destructible
-        self.is_destroyed = False
+
+class Tile:
+    """Lightweight view of one map cell (the cell itself is a byte in World.map)."""
+    __slots__ = ("world", "row", "col", "code")
+
+    def __init__(self, world, row, col, code):
+        self.world = world
+        self.row = row
+        self.col = col
+        self.code = code
+
+    @property
+    def is_destructible(self):
+        return self.code != SOLID
+
+    @property
+    def is_destroyed(self):
+        return self.world.map.get(self.row, self.col) == DESTROYED
+
+    @property
+    def rect(self):
+        size = self.world.tile_size
+        return pygame.Rect(self.col * size, self.row * size, size, size)
 
     def destroy(self):
         if self.is_destructible:
-            self.is_destroyed = True
-            self.kill() # Remove from all sprite groups
+            self.world.destroy_cell(self.row, self.col)
+
+FLOW_RADIUS = 40 # Cells searched around the player when building the flow field
+
+class FlowField:
+    """Shared navigation field: one BFS from the player's cell over a window of the tile map.
+
+    Every enemy reads its next cell from the same distance grid, so pathing costs one BFS per
+    player-cell change or map edit plus O(1) per enemy per frame. Enemies collide with
+    undestroyed destructible tiles, so those are the cells the search walks around.
+    """
+    def __init__(self, world, radius=FLOW_RADIUS):
+        self.world = world
+        self.radius = radius
+        self.origin = (0, 0) # Map cell of dist[0][0]
+        self.dist = None # Steps to the player's cell per window cell, -1 if unreachable
+        self.key = None
+        self.rebuilds = 0
+
+    def update(self, x, y):
+        """Rebuilds the field if the player changed cell or the map changed; returns whether it did."""
+        row, col = int(y) // self.world.tile_size, int(x) // self.world.tile_size
+        key = (row, col, self.world.version)
+        if key == self.key:
+            return False
+        self.key = key
+        self._build(row, col)
+        self.rebuilds += 1
+        return True
+
+    def _build(self, row, col):
+        world = self.world
+        r0, c0 = max(0, row - self.radius), max(0, col - self.radius)
+        r1, c1 = min(world.rows, row + self.radius + 1), min(world.cols, col + self.radius + 1)
+        if r0 >= r1 or c0 >= c1:
+            self.dist = None
+            return
+        rows, cols = np.mgrid[r0:r1, c0:c1]
+        width = c1 - c0
+        blocked = (world.map.codes_at(rows, cols) == DESTRUCTIBLE).ravel().tolist()
+        dist = [-1] * len(blocked)
+        start = (min(max(row, r0), r1 - 1) - r0) * width + min(max(col, c0), c1 - 1) - c0
+        dist[start] = 0 # The player's own cell counts as open even if they stand in a tile
+        frontier = deque([start])
+        while frontier:
+            i = frontier.popleft()
+            d = dist[i] + 1
+            x = i % width
+            for j in (i - width, i + width, i - 1 if x > 0 else -1, i + 1 if x < width - 1 else -1):
+                if 0 <= j < len(dist) and dist[j] < 0 and not blocked[j]:
+                    dist[j] = d
+                    frontier.append(j)
+        self.origin = (r0, c0)
+        self.dist = np.array(dist, np.int32).reshape(r1 - r0, width)
+
+    def distance(self, row, col):
+        if self.dist is None:
+            return -1
+        r, c = row - self.origin[0], col - self.origin[1]
+        if r < 0 or c < 0 or r >= self.dist.shape[0] or c >= self.dist.shape[1]:
+            return -1
+        return int(self.dist[r, c])
+
+    def next_waypoint(self, x, y):
+        """Pixel center of the neighbouring cell one step closer to the player, or None."""
+        size = self.world.tile_size
+        row, col = int(y) // size, int(x) // size
+        d = self.distance(row, col)
+        if d <= 0:
+            return None
+        for nr, nc in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            if self.distance(nr, nc) == d - 1:
+                return nc * size + size // 2, nr * size + size // 2
+        return None
 
 # Player class definition (already present)
 class Player(pygame.sprite.Sprite):
@@ -217,9 +520,32 @@ class Player(pygame.sprite.Sprite):
         self.rect.x = max(0, min(self.rect.x, pygame.display.get_surface().get_width() - self.rect.width))
         self.rect.y = max(0, min(self.rect.y, pygame.display.get_surface().get_height() - self.rect.height))
 
-def main():
+PROJECTILE_POOL_SIZE = 256
+GRENADE_POOL_SIZE = 32
+STRESS_POOL_SIZE = 5000
+ENEMY_COUNT = 8
+
+def spawn_enemies(world, player, count, group_list):
+    # Drop enemies on random open cells of the first screen, away from the player
+    size = world.tile_size
+    open_cells = [(r, c) for r in range(min(world.rows, world.screen_height // size)) for c in range(min(world.cols, world.screen_width // size))
+                  if world.map.get(r, c) != DESTRUCTIBLE and abs(c * size - player.rect.x) + abs(r * size - player.rect.y) > 4 * size]
+    for r, c in random.choices(open_cells, k=count) if open_cells else []:
+        enemy = Enemy((160, 0, 200), c * size + size // 4, r * size + size // 4, size // 2, 2, player, world)
+        for group in group_list:
+            group.add(enemy)
+
+def aim(player, target):
+    # Normalized direction from player center to a point, or None when they coincide
+    direction_x = target[0] - player.rect.centerx
+    direction_y = target[1] - player.rect.centery
+    magnitude = (direction_x**2 + direction_y**2)**0.5
+    if magnitude == 0:
+        return None
+    return direction_x / magnitude, direction_y / magnitude
+
+def main(stress=0, enemy_count=ENEMY_COUNT):
     pygame.init()
-    import random # Import random for map generation
 
     # Game window dimensions
     screen_width = 800
@@ -227,6 +553,7 @@ def main():
     tile_size = 40 # Size of each tile
     screen = pygame.display.set_mode((screen_width, screen_height))
     pygame.display.set_caption("Explosive Fun Game")
+    clock = pygame.time.Clock()
 
     # Initialize World
     world = World(screen_width, screen_height, tile_size)
@@ -234,65 +561,88 @@ def main():
 
     # Initialize player
     player = Player((255, 0, 0), screen_width // 2, screen_height // 2, 50, 5) # Red player, center of screen, size 50, speed 5
-    all_sprites = pygame.sprite.Group()
+    all_sprites = pygame.sprite.RenderUpdates() # draw() returns the rects it touched
     all_sprites.add(player)
     projectiles = pygame.sprite.Group() # Group for projectiles
     grenades = pygame.sprite.Group() # Group for grenades
+    enemies = pygame.sprite.Group() # Group for enemies
+    spawn_enemies(world, player, enemy_count, (enemies, all_sprites))
+
+    # Pools: every projectile / grenade is allocated up front and recycled on kill()
+    projectile_size = 10
+    projectile_speed = 10
+    projectile_pool = EntityPool(lambda: Projectile((255, 255, 0), 0, 0, projectile_size, 0, (0, 0), world),
+                                 max(PROJECTILE_POOL_SIZE, stress), world, projectiles, all_sprites)
+    grenade_pool = EntityPool(lambda: Grenade((0, 0, 255), 0, 0, 12, 0, (0, 0), world, 60, 50, 1500),
+                              GRENADE_POOL_SIZE, world, grenades, all_sprites)
 
     # Game loop
+    frame_times = []
     running = True
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            # Handle mouse click to fire projectile
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1: # Left mouse button
-                    mouse_pos = event.pos
-                    # Calculate direction from player center to mouse position
-                    player_center_x = player.rect.centerx
-                    player_center_y = player.rect.centery
-                    
-                    direction_x = mouse_pos[0] - player_center_x
-                    direction_y = mouse_pos[1] - player_center_y
-                    
-                    # Normalize direction vector
-                    magnitude = (direction_x**2 + direction_y**2)**0.5
-                    if magnitude > 0:
-                        direction_x /= magnitude
-                        direction_y /= magnitude
-                        
-                        # Create projectile
-                        projectile_size = 10
-                        projectile_speed = 10
-                        new_projectile = Projectile((255, 255, 0), player.rect.centerx, player.rect.centery, projectile_size, projectile_speed, (direction_x, direction_y), world)
-                        projectiles.add(new_projectile)
-                        all_sprites.add(new_projectile) # Add projectile to all_sprites for drawing
-            
-            # Handle input and update player
-            keys = pygame.key.get_pressed()
-            player.update(keys)
-
-        # Update projectiles
-        projectiles.update(world) # Pass world to projectile update for collision checking
-
-        # Game logic and rendering will go here
-
-        # Fill the background with a color
-        screen.fill((30, 30, 30)) # Dark grey background
-
-        # Draw world tiles
-        world.draw(screen)
-
-        # Draw all sprites (player and projectiles)
-        all_sprites.draw(screen)
-
-        # Update the display
-        pygame.display.flip()
+            # Handle mouse click: left fires a projectile, right throws a grenade
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 3):
+                direction = aim(player, event.pos)
+                if direction:
+                    if event.button == 1:
+                        projectile_pool.spawn(player.rect.centerx, player.rect.centery, projectile_speed, direction, 1000)
+                    else:
+                        grenade_pool.spawn(player.rect.centerx, player.rect.centery, 6, direction, grenade_pool.sprites[0].detonation_timer)
+
+        # Stress mode: keep the projectile pool saturated with shots in random directions
+        for _ in range(min(len(projectile_pool.free), stress // 30)):
+            angle = random.uniform(0, 6.283185307179586)
+            projectile_pool.spawn(player.rect.centerx, player.rect.centery, projectile_speed, (np.cos(angle), np.sin(angle)), 1000)
+
+        # Handle input and update player
+        keys = pygame.key.get_pressed()
+        player.update(keys)
+
+        # Keep the map chunks around the player loaded
+        world.stream_around(player.rect.centerx, player.rect.centery)
+
+        # One flow-field rebuild when the player changes cell or the map changes; enemies just read it
+        world.flow.update(player.rect.centerx, player.rect.centery)
+        enemies.update()
+
+        # Move projectiles and grenades as one batch per pool, then resolve tile hits
+        projectile_pool.update(screen_width, screen_height)
+        grenade_pool.update(screen_width, screen_height)
+
+        # Erase sprites by restoring the cached tile layer under their old positions
+        all_sprites.clear(screen, world.background)
+
+        # Copy cells repainted by destruction (the whole layer on the first frame)
+        dirty = world.pop_dirty()
+        for rect in dirty:
+            screen.blit(world.background, rect, rect)
+
+        # Draw all sprites (player and projectiles); RenderUpdates reports old + new areas
+        dirty += all_sprites.draw(screen)
+
+        # Push only the changed areas to the display
+        pygame.display.update(dirty)
+
+        if stress:
+            frame_times.append(clock.tick()) # Uncapped, so the frame time is the real cost
+            if len(frame_times) % 60 == 0:
+                pygame.display.set_caption(f"Explosive Fun Game - stress {len(projectile_pool)} projectiles, {clock.get_fps():.0f} FPS")
+        else:
+            clock.tick(60)
 
     pygame.quit()
+    if frame_times:
+        logging.info(f"Stress: {len(frame_times)} frames, {sum(frame_times) / len(frame_times):.2f} ms/frame avg")
 
 if __name__ == "__main__":
-    main()
-
-
+    import argparse
+    parser = argparse.ArgumentParser(description="Explosive Fun Game")
+    parser.add_argument("--stress", type=int, nargs="?", const=STRESS_POOL_SIZE, default=0,
+                        help="keep this many projectiles in flight to measure frame cost (default %(const)s)")
+    parser.add_argument("--enemies", type=int, default=ENEMY_COUNT, help="enemies to spawn (default %(default)s)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main(args.stress, args.enemies)
@@ -0,0 +1,155 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from aiohttp import web
+
+METRICS_HOST = "127.0.0.1" # Loopback unless the deployment opts in (the container binds 0.0.0.0)
+METRICS_PORT = 8080
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RECENT_SAMPLES = 512 # Raw observations kept per label set for !status percentiles
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+class _Metric:
+    kind = "untyped"
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock() # DB timings are observed from worker threads
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+    def __init__(self, name, help_text, source=None):
+        super().__init__(name, help_text)
+        self.source = source # Optional callable -> [(label dict, value)] for counts kept elsewhere
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock: self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        values = dict(self.values)
+        if self.source: values.update({_label_key(l): v for l, v in self.source()})
+        return values
+
+    def lines(self):
+        return self.header() + [f"{self.name}{_format_labels(k)} {v}" for k, v in self.collect().items()]
+
+class Gauge(Counter):
+    """Set directly or, with `source`, read at scrape time."""
+    kind = "gauge"
+    def set(self, value, **labels):
+        with self._lock: self.values[_label_key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self.series = {} # label key -> [bucket counts, sum, count, recent deque]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            s = self.series.get(key)
+            if s is None: s = self.series[key] = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=RECENT_SAMPLES)]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets): s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+            s[3].append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(time.perf_counter() - start, **labels)
+
+    def quantiles(self, qs=(0.5, 0.95), **labels):
+        """Percentiles over the recent window of one label set (all label sets if none given), or None."""
+        with self._lock:
+            if labels: samples = list(self.series.get(_label_key(labels), (None,) * 4)[3] or ())
+            else: samples = [v for s in self.series.values() for v in s[3]]
+        if not samples: return None
+        samples.sort()
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in qs]
+
+    def lines(self):
+        out = self.header()
+        with self._lock:
+            series = {k: (list(s[0]), s[1], s[2]) for k, s in self.series.items()}
+        for key, (counts, total, count) in series.items():
+            running = 0
+            for le, c in zip(self.buckets, counts):
+                running += c
+                out.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {running}")
+            out.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            out.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            out.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, source=None): return self.register(Counter(name, help_text, source))
+    def gauge(self, name, help_text, source=None): return self.register(Gauge(name, help_text, source))
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS): return self.register(Histogram(name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try: lines += metric.lines()
+            except Exception as e: logging.warning(f"Metric {metric.name} failed to collect: {e}")
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves a registry in the Prometheus text format at /metrics."""
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def _handle(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        if self._runner: return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logging.info(f"Metrics on http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logging.error(f"Metrics endpoint unavailable on port {self.port}: {e}")
+            await self.stop()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+registry = Registry()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import aiohttp
+
+# (name, feed url) pairs; RSS 2.0 and Atom are both understood
+SOURCES = [
+    ("THN", "https://feeds.feedburner.com/TheHackersNews"),
+    ("BleepingComputer", "https://www.bleepingcomputer.com/feed/"),
+    ("LWN", "https://lwn.net/headlines/rss"),
+    ("Phoronix", "https://www.phoronix.com/rss.php"),
+    ("Krebs", "https://krebsonsecurity.com/feed/"),
+    ("CISA", "https://www.cisa.gov/cybersecurity-advisories/all.xml"),
+]
+SOURCE_TIMEOUT = 10 # Seconds per feed; a slow feed only loses its own results
+MAX_ITEMS_PER_SOURCE = 25
+CRITICAL_PATTERNS = re.compile(r"\b(?:zero[- ]day|0-day|actively exploited|critical|ransomware|rce|remote code execution|cve-\d{4}-\d+|emergency patch|breach)\b", re.I)
+
+def classify(headline, summary):
+    return "CRITICAL" if CRITICAL_PATTERNS.search(f"{headline} {summary}") else "INFO"
+
+def _text(el, *tags):
+    for tag in tags:
+        found = el.find(tag)
+        if found is not None and (found.text or found.get("href")):
+            return (found.text or found.get("href")).strip()
+    return ""
+
+def _parse_date(value):
+    for parse in (parsedate_to_datetime, lambda v: datetime.fromisoformat(v.replace("Z", "+00:00"))):
+        try:
+            stamp = parse(value)
+            return stamp.astimezone().replace(tzinfo=None) if stamp.tzinfo else stamp
+        except (TypeError, ValueError, IndexError):
+            continue
+    return datetime.now()
+
+def parse_feed(source, body):
+    """Parses RSS/Atom bytes into news_history-shaped dicts."""
+    root = ET.fromstring(body)
+    atom = "{http://www.w3.org/2005/Atom}"
+    entries = root.findall(".//item") or root.findall(f".//{atom}entry")
+    items = []
+    for e in entries[:MAX_ITEMS_PER_SOURCE]:
+        headline = _text(e, "title", f"{atom}title")
+        link = _text(e, "link", f"{atom}link")
+        summary = re.sub(r"<[^>]+>", "", _text(e, "description", f"{atom}summary", f"{atom}content"))
+        summary = re.sub(r"\s+", " ", summary).strip()[:500]
+        published = _text(e, "pubDate", f"{atom}updated", f"{atom}published")
+        stamp = _parse_date(published)
+        if headline and link:
+            items.append({"headline": headline, "link": link, "summary": summary, "source": source,
+                          "priority": classify(headline, summary), "timestamp": stamp.strftime("%Y-%m-%d %H:%M:%S")})
+    return items
+
+class NewsStore:
+    """Write side of the intel DB: bulk inserts into news_history, deduped by link against every row
+    (including ones other writers such as briefing.py add), via an index on news_history.link."""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.ready = False
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            self._init_db()
+            self.ready = True
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"News store unavailable at {db_path}: {e}")
+
+    def _init_db(self):
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS news_history (headline TEXT, priority TEXT, source TEXT, link TEXT, summary TEXT, timestamp TEXT)''')
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS idx_news_link ON news_history (link)''')
+            self.conn.execute("DROP TABLE IF EXISTS news_seen") # Side table missed rows from other writers
+
+    def insert(self, items):
+        """Inserts unseen items in one transaction; returns the ones that were new."""
+        if not self.ready or not items: return []
+        new = []
+        with self._lock, self.conn:
+            for item in items:
+                cur = self.conn.execute("INSERT INTO news_history (headline, priority, source, link, summary, timestamp) "
+                                        "SELECT :headline, :priority, :source, :link, :summary, :timestamp "
+                                        "WHERE NOT EXISTS (SELECT 1 FROM news_history WHERE link = :link)", item)
+                if cur.rowcount: new.append(item)
+        return new
+
+class NewsPipeline:
+    """Fetches every source concurrently and yields (source, new_items, error) as each one finishes."""
+    def __init__(self, db_path, sources=SOURCES, timeout=SOURCE_TIMEOUT):
+        self.store = NewsStore(db_path)
+        self.sources = sources
+        self.timeout = timeout
+        self.last_scan = 0.0
+        self._session = None
+        self._scan_lock = asyncio.Lock()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers={"User-Agent": "ClairBot/1.0 (+news)"}, connector=aiohttp.TCPConnector(limit=16))
+        return self._session
+
+    async def _fetch(self, name, url):
+        try:
+            async with self._get_session().get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as r:
+                r.raise_for_status()
+                body = await r.read()
+            items = await asyncio.to_thread(parse_feed, name, body)
+            return name, await asyncio.to_thread(self.store.insert, items), None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ET.ParseError, sqlite3.Error) as e:
+            return name, [], e.__class__.__name__
+
+    async def scan(self):
+        """Async generator over per-source results, in completion order. Concurrent scans share one run."""
+        async with self._scan_lock:
+            for done in asyncio.as_completed([self._fetch(name, url) for name, url in self.sources]):
+                name, new, error = await done
+                if error: logging.warning(f"News source {name} failed: {error}")
+                yield name, new, error
+            self.last_scan = time.monotonic()
+
+    async def run_once(self):
+        total = 0
+        async for _, new, _ in self.scan(): total += len(new)
+        if total: logging.info(f"News scan stored {total} new items")
+        return total
+
+    def is_fresh(self, max_age):
+        return self.last_scan and time.monotonic() - self.last_scan < max_age
+
+    async def run_forever(self, interval):
+        while True:
+            try: await self.run_once()
+            except Exception as e: logging.error(f"News scan failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import aiohttp
+
+OLLAMA_URL = "http://localhost:11434"
+
+# Pool / timeout defaults (override per instance)
+MAX_CONCURRENT = 4          # Requests in flight against Ollama at once
+POOL_SIZE = 16              # Keep-alive sockets held open in the connector
+CONNECT_TIMEOUT = 5         # Seconds to establish the TCP connection
+REQUEST_TIMEOUT = 300       # Seconds for a full (non-streamed) generation
+STREAM_IDLE_TIMEOUT = 60    # Seconds without a token before a stream is abandoned
+
+class OllamaError(Exception):
+    """Raised when Ollama answers with a non-200 status."""
+    def __init__(self, status, text):
+        super().__init__(f"Ollama HTTP {status}: {text}")
+        self.status = status
+        self.text = text
+
+class OllamaClient:
+    """Async Ollama client on one pooled keep-alive aiohttp session.
+
+    The session is created lazily inside the running loop, and a semaphore caps
+    how many generations hit the GPU at once so channels queue instead of piling up.
+    """
+    def __init__(self, base_url=OLLAMA_URL, max_concurrent=MAX_CONCURRENT, pool_size=POOL_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, request_timeout=REQUEST_TIMEOUT, stream_idle_timeout=STREAM_IDLE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=request_timeout, connect=connect_timeout)
+        # Streams can legitimately run long, so only the gap between tokens is bounded
+        self.stream_timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=stream_idle_timeout)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def _post(self, path, payload):
+        async with self._slots:
+            async with self._get_session().post(f"{self.base_url}{path}", json=payload) as r:
+                if r.status != 200:
+                    raise OllamaError(r.status, await r.text())
+                return await r.json()
+
+    async def _get(self, path):
+        async with self._get_session().get(f"{self.base_url}{path}") as r:
+            if r.status != 200:
+                raise OllamaError(r.status, await r.text())
+            return await r.json()
+
+    async def chat(self, model, messages, keep_alive=None):
+        """Runs a non-streamed chat completion and returns the reply text."""
+        payload = {"model": model, "messages": messages, "stream": False}
+        if keep_alive is not None: payload["keep_alive"] = keep_alive
+        data = await self._post("/api/chat", payload)
+        return data['message']['content']
+
+    async def chat_stream(self, model, messages, keep_alive=None):
+        """Streams a chat completion, yielding content fragments from Ollama's NDJSON lines."""
+        payload = {"model": model, "messages": messages, "stream": True}
+        if keep_alive is not None: payload["keep_alive"] = keep_alive
+        async with self._slots:
+            async with self._get_session().post(f"{self.base_url}/api/chat", json=payload, timeout=self.stream_timeout) as r:
+                if r.status != 200:
+                    raise OllamaError(r.status, await r.text())
+                async for line in r.content:
+                    line = line.strip()
+                    if not line: continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise OllamaError(r.status, chunk["error"])
+                    text = chunk.get("message", {}).get("content", "")
+                    if text: yield text
+                    if chunk.get("done"): break
+
+    async def embed(self, model, inputs, keep_alive=None):
+        """Returns one embedding vector per input string (/api/embed)."""
+        payload = {"model": model, "input": inputs}
+        if keep_alive is not None: payload["keep_alive"] = keep_alive
+        data = await self._post("/api/embed", payload)
+        return data['embeddings']
+
+    async def loaded(self):
+        """Names of the models currently resident in VRAM (None if Ollama cannot be asked)."""
+        try:
+            data = await self._get("/api/ps")
+            return [m['name'] for m in data.get('models', [])]
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError) as e:
+            logging.warning(f"Ollama ps failed: {e}")
+            return None
+
+    async def preload(self, model, keep_alive=None, embedding=False):
+        """Loads a model into VRAM without generating (an empty request), so the next call starts warm."""
+        payload = {"model": model, "input": []} if embedding else {"model": model}
+        if keep_alive is not None: payload["keep_alive"] = keep_alive
+        try:
+            await self._post("/api/embed" if embedding else "/api/generate", payload)
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError) as e:
+            logging.warning(f"Ollama preload failed for {model}: {e}")
+            return False
+
+    async def unload(self, model):
+        """Asks Ollama to evict a model from VRAM right away (keep_alive=0)."""
+        try:
+            await self._post("/api/generate", {"model": model, "keep_alive": 0})
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError, OllamaError) as e:
+            logging.warning(f"Ollama unload failed for {model}: {e}")
+            return False
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
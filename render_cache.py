@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+
+CACHE_DIR = "render_cache"
+CACHE_MAX_BYTES = 2 * 1024**3 # 2 GB of PNGs
+
+def normalize_prompt(text):
+    """Lowercases, collapses whitespace and drops empty tags so trivially different prompts share a key."""
+    tags = [re.sub(r"\s+", " ", t).strip() for t in text.lower().split(",")]
+    return ", ".join(t for t in tags if t)
+
+def derive_seed(positive_text, negative_text=""):
+    """Stable seed for deterministic mode when the user does not pick one."""
+    digest = hashlib.sha256(f"{normalize_prompt(positive_text)}|{normalize_prompt(negative_text)}".encode()).digest()
+    return int.from_bytes(digest[:4], "big")
+
+def cache_key(request):
+    fields = {
+        "positive": normalize_prompt(request.positive_text),
+        "negative": normalize_prompt(request.negative_text),
+        "seed": request.seed, "template": request.template.name, "checkpoint": request.checkpoint, "steps": request.steps,
+        "cfg": request.cfg, "sampler": request.sampler, "width": request.width, "height": request.height,
+    }
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+class RenderCache:
+    """Content-addressed on-disk cache for deterministic (seeded) renders, LRU-evicted by size.
+
+    Files are named `<key>.<n>.png`; recency lives in an in-memory OrderedDict rebuilt from
+    file mtimes at startup, and hits bump the mtime so the order survives restarts.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (paths, size), oldest first
+        self._size = 0
+        self._lock = asyncio.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        found = {}
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".png"): continue
+            path = os.path.join(self.cache_dir, name)
+            st = os.stat(path)
+            paths, size, mtime = found.get(name.split(".")[0], ([], 0, 0))
+            found[name.split(".")[0]] = (paths + [path], size + st.st_size, max(mtime, st.st_mtime))
+        for key, (paths, size, _) in sorted(found.items(), key=lambda kv: kv[1][2]):
+            self._entries[key] = (sorted(paths), size)
+            self._size += size
+
+    async def get(self, request):
+        """Returns the cached images for a deterministic request, or None."""
+        if not request.deterministic: return None
+        key = cache_key(request)
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            images = await asyncio.to_thread(self._read, entry[0])
+        except OSError as e:
+            logging.warning(f"Render cache read failed for {key}: {e}")
+            async with self._lock: self._drop(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return images
+
+    async def put(self, request, images):
+        if not request.deterministic or not images: return
+        key = cache_key(request)
+        paths = [os.path.join(self.cache_dir, f"{key}.{i}.png") for i in range(len(images))]
+        try:
+            await asyncio.to_thread(self._write, paths, images)
+        except OSError as e:
+            logging.warning(f"Render cache write failed for {key}: {e}")
+            return
+        async with self._lock:
+            self._drop(key)
+            self._entries[key] = (paths, sum(len(img) for img in images))
+            self._size += self._entries[key][1]
+            evicted = []
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                old_key = next(iter(self._entries))
+                evicted += self._entries[old_key][0]
+                self._drop(old_key)
+        if evicted: await asyncio.to_thread(self._unlink, evicted)
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self._size, "hits": self.hits, "misses": self.misses}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry: self._size -= entry[1]
+
+    @staticmethod
+    def _read(paths):
+        images = []
+        for path in paths:
+            with open(path, "rb") as f: images.append(f.read())
+            os.utime(path) # Persist LRU order across restarts
+        return images
+
+    @staticmethod
+    def _write(paths, images):
+        for path, img in zip(paths, images):
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f: f.write(img)
+            os.replace(tmp, path)
+
+    @staticmethod
+    def _unlink(paths):
+        for path in paths:
+            try: os.remove(path)
+            except FileNotFoundError: pass
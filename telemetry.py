@@ -0,0 +1,111 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import subprocess
+import time
+from collections import deque, namedtuple
+import psutil
+
+SAMPLE_INTERVAL = 5   # Seconds between samples
+HISTORY_MINUTES = 15  # Ring buffer span
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+SPARK_WIDTH = 20
+
+Sample = namedtuple("Sample", "t cpu ram gpu_load gpu_temp vram_used vram_total")
+GpuReading = namedtuple("GpuReading", "load temp vram_used vram_total") # %, °C, MB, MB
+
+def _read_int(path):
+    with open(path) as f: return int(f.read().strip())
+
+class AmdGpuReader:
+    """Reads load / temperature / VRAM straight from the amdgpu sysfs files, falling back to rocm-smi."""
+    def __init__(self, sysfs_root="/sys/class/drm"):
+        self.device = self._find_device(sysfs_root)
+        self.hwmon = next(iter(glob.glob(os.path.join(self.device, "hwmon", "hwmon*"))), None) if self.device else None
+        if self.device: logging.info(f"GPU telemetry via sysfs: {self.device}")
+
+    @staticmethod
+    def _find_device(root):
+        # Largest VRAM wins, so an iGPU never shadows the 7900 XT
+        cards = [d for d in glob.glob(os.path.join(root, "card[0-9]*", "device")) if os.path.exists(os.path.join(d, "mem_info_vram_total"))]
+        return max(cards, key=lambda d: _read_int(os.path.join(d, "mem_info_vram_total")), default=None)
+
+    def read(self):
+        if self.device:
+            try: return self._read_sysfs()
+            except (OSError, ValueError) as e: logging.debug(f"sysfs GPU read failed: {e}")
+        return self._read_rocm_smi()
+
+    def _read_sysfs(self):
+        temp = _read_int(os.path.join(self.hwmon, "temp1_input")) / 1000 if self.hwmon else None
+        return GpuReading(
+            load=_read_int(os.path.join(self.device, "gpu_busy_percent")),
+            temp=temp,
+            vram_used=_read_int(os.path.join(self.device, "mem_info_vram_used")) // 1024**2,
+            vram_total=_read_int(os.path.join(self.device, "mem_info_vram_total")) // 1024**2,
+        )
+
+    @staticmethod
+    def _read_rocm_smi():
+        try:
+            result = subprocess.run(
+                ["rocm-smi", "--showmeminfo", "vram", "--showuse", "--showtemp", "--json"],
+                capture_output=True, text=True, timeout=5
+            )
+            if result.returncode != 0: return None
+            card = next(iter(json.loads(result.stdout).values()))
+            return GpuReading(
+                load=float(card.get("GPU use (%)", 0)),
+                temp=float(card.get("Temperature (Sensor edge) (C)", 0)),
+                vram_used=int(card.get("VRAM Total Used Memory (B)", 0)) // 1024**2,
+                vram_total=int(card.get("VRAM Total Memory (B)", 0)) // 1024**2,
+            )
+        except (OSError, subprocess.TimeoutExpired, ValueError, StopIteration):
+            return None
+
+def sparkline(values, width=SPARK_WIDTH):
+    """Unicode sparkline of the last `width` buckets (bucket = mean of its samples)."""
+    values = [v for v in values if v is not None]
+    if not values: return ""
+    step = max(1, len(values) // width)
+    buckets = [sum(values[i:i + step]) / len(values[i:i + step]) for i in range(0, len(values), step)][-width:]
+    lo, hi = min(buckets), max(buckets)
+    span = (hi - lo) or 1
+    return "".join(SPARK_CHARS[int((v - lo) / span * (len(SPARK_CHARS) - 1))] for v in buckets)
+
+class TelemetrySampler:
+    """Polls CPU / RAM / GPU every `interval` seconds into a fixed-size ring buffer.
+
+    Readers never block on hardware: `latest` and `summary()` only look at the buffer.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL, minutes=HISTORY_MINUTES, gpu=None):
+        self.interval = interval
+        self.samples = deque(maxlen=max(1, int(minutes * 60 / interval)))
+        self.gpu = gpu or AmdGpuReader()
+        psutil.cpu_percent() # Prime the counter; the next call measures the interval since this one
+
+    def sample(self):
+        gpu = self.gpu.read()
+        s = Sample(time.time(), psutil.cpu_percent(), psutil.virtual_memory().percent,
+                   *(gpu if gpu else (None, None, None, None)))
+        self.samples.append(s)
+        return s
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def summary(self, field, minutes=None):
+        """(current, min, avg, max, sparkline) for one Sample field, or None without data."""
+        cutoff = time.time() - minutes * 60 if minutes else 0
+        values = [getattr(s, field) for s in self.samples if s.t >= cutoff and getattr(s, field) is not None]
+        if not values: return None
+        return values[-1], min(values), sum(values) / len(values), max(values), sparkline(values)
+
+    async def run_forever(self):
+        while True:
+            try: await asyncio.to_thread(self.sample)
+            except Exception as e: logging.warning(f"Telemetry sample failed: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,123 @@
+import asyncio
+import unittest
+import workflow_templates
+from comfy_client import ComfyClient, ComfyError, RenderBatcher, RenderRequest, merge_workflows
+
+WS_GRAPH = {
+    "9": {"class_type": workflow_templates.WS_OUTPUT_NODE, "inputs": {}},
+    "3": {"class_type": "KSampler", "inputs": {}},
+}
+
+class TestGetOutputs(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = ComfyClient()
+
+    async def test_streamed_images_are_returned(self):
+        """Test if websocket frames are served without touching /history."""
+        self.client._ws_outputs["p1"] = {"9": [b"png"]}
+        self.assertEqual(await self.client.get_outputs("p1", WS_GRAPH), {"9": [b"png"]})
+        self.assertNotIn("p1", self.client._ws_outputs)
+
+    async def test_missing_stream_raises(self):
+        """Test if a websocket graph that streamed nothing fails loudly instead of returning no images."""
+        with self.assertRaises(ComfyError):
+            await self.client.get_outputs("p2", WS_GRAPH)
+
+class FakeComfy:
+    """Records each executed graph and returns one image per latent in every output node's branch."""
+    def __init__(self):
+        self.graphs = []
+
+    async def execute(self, graph, on_progress=None):
+        self.graphs.append(graph)
+        return f"p{len(self.graphs)}"
+
+    async def get_outputs(self, prompt_id, graph):
+        outputs = {}
+        for node_id, node in graph.items():
+            if node['class_type'] != workflow_templates.WS_OUTPUT_NODE: continue
+            sampler = graph[graph[node['inputs']['images'][0]]['inputs']['samples'][0]]
+            latent = graph[sampler['inputs']['latent_image'][0]]
+            text = graph[sampler['inputs']['positive'][0]]['inputs']['text']
+            outputs[node_id] = [f"{prompt_id}:{node_id}:{text}:{k}".encode() for k in range(latent['inputs']['batch_size'])]
+        return outputs
+
+def classes(graph, class_type):
+    return [n for n in graph.values() if n['class_type'] == class_type]
+
+class TestMergeWorkflows(unittest.TestCase):
+
+    def test_shared_nodes_are_deduplicated(self):
+        """Test if two prompts share the loader and negative encoder but keep their own samplers and outputs."""
+        graph, outputs = merge_workflows([RenderRequest("a cat", "blurry", seed=1).build(), RenderRequest("a dog", "blurry", seed=1).build()])
+        self.assertEqual(len(classes(graph, "CheckpointLoaderSimple")), 1)
+        self.assertEqual(len(classes(graph, "CLIPTextEncode")), 3) # Two positives, one shared negative
+        self.assertEqual(len(classes(graph, "KSampler")), 2)
+        self.assertEqual([len(o) for o in outputs], [1, 1])
+        self.assertNotEqual(outputs[0], outputs[1])
+        for node in graph.values(): # Every link points at a node of the merged graph
+            for value in node['inputs'].values():
+                if isinstance(value, list): self.assertIn(value[0], graph)
+
+    def test_identical_graphs_keep_separate_outputs(self):
+        """Test if output nodes are never shared, even for identical graphs."""
+        graph, outputs = merge_workflows([RenderRequest("x", seed=3).build()] * 2)
+        self.assertEqual(len(classes(graph, "KSampler")), 1)
+        self.assertEqual(len(classes(graph, workflow_templates.WS_OUTPUT_NODE)), 2)
+        self.assertEqual(len({o[0] for o in outputs}), 2)
+
+class TestRenderBatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.comfy = FakeComfy()
+        self.batcher = RenderBatcher(self.comfy, window=0.01)
+
+    async def render(self, *requests):
+        return await asyncio.gather(*(self.batcher.submit(r) for r in requests))
+
+    async def test_identical_prompts_share_a_batch(self):
+        """Test if identical unseeded prompts become one sampler with batch_size n, one image each."""
+        results = await self.render(RenderRequest("cat"), RenderRequest("cat"), RenderRequest("cat"))
+        self.assertEqual(len(self.comfy.graphs), 1)
+        self.assertEqual(classes(self.comfy.graphs[0], "EmptyLatentImage")[0]['inputs']['batch_size'], 3)
+        self.assertEqual([len(r) for r in results], [1, 1, 1])
+        self.assertEqual(len({r[0] for r in results}), 3)
+
+    async def test_different_prompts_become_branches(self):
+        """Test if compatible prompts share one graph and each gets its own branch's images."""
+        cat, dog = await self.render(RenderRequest("cat"), RenderRequest("dog"))
+        self.assertEqual(len(self.comfy.graphs), 1)
+        self.assertEqual(len(classes(self.comfy.graphs[0], "KSampler")), 2)
+        self.assertIn(b":cat", cat[0])
+        self.assertIn(b":dog", dog[0])
+
+    async def test_seeded_duplicates_share_one_image(self):
+        """Test if identical seeded requests render once and all receive that image."""
+        results = await self.render(*(RenderRequest("cat", seed=42) for _ in range(3)))
+        self.assertEqual(classes(self.comfy.graphs[0], "EmptyLatentImage")[0]['inputs']['batch_size'], 1)
+        self.assertEqual(results, [results[0]] * 3)
+        self.assertEqual(len(results[0]), 1)
+
+    async def test_incompatible_keys_go_out_separately(self):
+        """Test if requests with different sizes are sent as separate prompts."""
+        square, wide = await self.render(RenderRequest("cat"), RenderRequest("cat", width=1344, height=768))
+        self.assertEqual(len(self.comfy.graphs), 2)
+        self.assertEqual(len(square), 1)
+        self.assertEqual(len(wide), 1)
+
+    async def test_full_group_flushes_early(self):
+        """Test if reaching max_batch sends the group without waiting for the window."""
+        self.batcher = RenderBatcher(self.comfy, window=60, max_batch=2)
+        results = await asyncio.wait_for(self.render(RenderRequest("a"), RenderRequest("b")), 1)
+        self.assertEqual([len(r) for r in results], [1, 1])
+
+    async def test_errors_reach_every_request(self):
+        """Test if a failed prompt fails every request in its group."""
+        async def boom(graph, on_progress=None): raise ComfyError("oom")
+        self.comfy.execute = boom
+        results = await asyncio.gather(*(self.batcher.submit(RenderRequest(t)) for t in ("a", "b")), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ComfyError) for r in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from context_builder import ContextBuilder, count_tokens, truncate_to_tokens
+
+def system_fn(memory):
+    return "You are Clair." + (f"\n{memory}" if memory else "")
+
+class TestContextBuilder(unittest.TestCase):
+
+    def test_history_fills_newest_first(self):
+        """Test if the oldest turns are the ones dropped, and ids never reach the payload."""
+        builder = ContextBuilder(budget=60)
+        history = [{"id": i, "role": "user", "content": "word " * 10} for i in range(5)]
+        msgs, dropped = builder.build(system_fn, None, None, history, {"role": "user", "content": "hi"})
+        self.assertGreater(dropped, 0)
+        self.assertEqual(len(msgs), 2 + len(history) - dropped)
+        self.assertTrue(all("id" not in m for m in msgs))
+
+    def test_long_user_turn_is_capped(self):
+        """Test if a pasted log is cut to its share instead of overrunning the budget."""
+        builder = ContextBuilder(budget=200, user_share=0.5)
+        pasted = {"role": "user", "content": "ERROR disk full " * 500, "images": ["b64"]}
+        msgs, _ = builder.build(system_fn, None, None, [], pasted)
+        self.assertLessEqual(count_tokens(msgs[-1]["content"]), 100)
+        self.assertTrue(msgs[-1]["content"].startswith("ERROR disk full"))
+        self.assertEqual(msgs[-1]["images"], ["b64"])
+        self.assertEqual(len(pasted["content"]), len("ERROR disk full " * 500)) # Caller's dict untouched
+
+    def test_truncate_keeps_whole_lines(self):
+        """Test if truncation stops at a line boundary once one line fits."""
+        text = "one two\nthree four\nfive six"
+        self.assertEqual(truncate_to_tokens(text, 6), "one two\nthree four")
+
+if __name__ == '__main__':
+    unittest.main()
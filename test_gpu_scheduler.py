@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+from gpu_scheduler import GpuScheduler, CHAT, VISION, IMAGE
+
+class TestGpuScheduler(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.events = [] # ("switch", old, new) / ("start", name) / ("end", name)
+        self.sched = GpuScheduler(self.on_switch)
+        self.gates = {}
+
+    async def asyncTearDown(self):
+        await self.sched.stop()
+
+    async def on_switch(self, old, new):
+        self.assertEqual(self.sched.running, 0, "switched with jobs still on the GPU")
+        self.events.append(("switch", old, new))
+
+    def job(self, name):
+        gate = self.gates[name] = asyncio.Event()
+        async def fn():
+            self.events.append(("start", name))
+            await gate.wait()
+            self.events.append(("end", name))
+            return name
+        return fn
+
+    def starts(self):
+        return [e[1] for e in self.events if e[0] == "start"]
+
+    async def settle(self):
+        for _ in range(20): await asyncio.sleep(0)
+
+    async def test_position_follows_dispatch_order(self):
+        """Test if a chat queued behind images, but inside the current chat batch, reports position 0."""
+        self.sched.mode = CHAT
+        submitted = [self.sched.submit(mode, self.job(name)) for mode, name in
+                     ((CHAT, "c1"), (IMAGE, "i1"), (IMAGE, "i2"), (CHAT, "c2"))]
+        self.assertEqual([pos for _, pos in submitted], [0, 2, 3, 0])
+        self.assertEqual(self.sched.upcoming(), [CHAT, IMAGE])
+        await self.settle()
+        self.assertEqual(self.starts(), ["c1", "c2"]) # Both chats ran at once
+        for name in ("c1", "c2", "i1", "i2"):
+            self.gates[name].set()
+        await asyncio.gather(*(f for f, _ in submitted))
+        self.assertEqual(self.starts(), ["c1", "c2", "i1", "i2"])
+
+    async def test_position_counts_full_slots(self):
+        """Test if a job waiting for a concurrency slot is not reported as starting now."""
+        self.sched.mode = IMAGE # One render at a time
+        _, first = self.sched.submit(IMAGE, self.job("i1"))
+        _, second = self.sched.submit(IMAGE, self.job("i2"))
+        self.assertEqual((first, second), (0, 2))
+
+    async def test_batching_bounds_starvation(self):
+        """Test if a waiting mode gets the GPU after max_batch jobs of the current one."""
+        self.sched = GpuScheduler(self.on_switch, max_batch={CHAT: 2})
+        futures = [self.sched.submit(CHAT, self.job(f"c{i}"))[0] for i in range(3)]
+        futures.append(self.sched.submit(IMAGE, self.job("i1"))[0])
+        for gate in self.gates.values(): gate.set()
+        await asyncio.gather(*futures)
+        self.assertEqual(self.starts(), ["c0", "c1", "i1", "c2"])
+        self.assertEqual(self.sched.switch_counts, {"chat->image": 1, "image->chat": 1})
+
+    async def test_switch_drains_running_jobs(self):
+        """Test if a switch waits for the old mode's jobs and holds back new ones of that mode."""
+        self.sched.mode = CHAT
+        chat, _ = self.sched.submit(CHAT, self.job("c1"))
+        await self.settle()
+        image, _ = self.sched.submit(IMAGE, self.job("i1"))
+        await self.settle()
+        late, pos = self.sched.submit(CHAT, self.job("c2")) # Arrives while draining for the image
+        self.assertGreater(pos, 0)
+        await self.settle()
+        self.assertEqual(self.starts(), ["c1"])
+        self.gates["c1"].set()
+        self.gates["i1"].set()
+        self.gates["c2"].set()
+        await asyncio.gather(chat, image, late)
+        self.assertEqual(self.starts(), ["c1", "i1", "c2"])
+        self.assertLess(self.events.index(("end", "c1")), self.events.index(("switch", CHAT, IMAGE)))
+
+    async def test_idle_handoff(self):
+        """Test if an idle GPU goes back to idle_mode after idle_delay, and not before."""
+        self.sched = GpuScheduler(self.on_switch, idle_mode=CHAT, idle_delay=0.05)
+        render = self.job("i1")
+        self.gates["i1"].set()
+        await self.sched.run(IMAGE, render)
+        self.assertEqual(self.sched.mode, IMAGE)
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.sched.mode, CHAT)
+        self.assertEqual(self.events[-1], ("switch", IMAGE, CHAT))
+
+    async def test_job_errors_reach_caller(self):
+        """Test if an exception in a job is raised to its submitter and frees the slot."""
+        async def boom(): raise RuntimeError("oom")
+        with self.assertRaises(RuntimeError):
+            await self.sched.run(VISION, boom)
+        self.assertEqual(self.sched.running, 0)
+
+if __name__ == '__main__':
+    unittest.main()
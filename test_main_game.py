@@ -0,0 +1,109 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import unittest
+import numpy as np
+from main_game import TileMap, World, SOLID, DESTRUCTIBLE, DESTROYED, OUTSIDE
+
+class TestTileMap(unittest.TestCase):
+
+    def setUp(self):
+        self.map = TileMap(300, 300, density=0.5, seed=1234, chunk_size=64)
+
+    def test_chunks_regenerate_identically(self):
+        """Test if an unloaded chunk comes back the same, and the seed decides the layout."""
+        first = bytes(self.map.chunk(1, 2))
+        self.map.chunks.clear()
+        self.assertEqual(bytes(self.map.chunk(1, 2)), first)
+        self.assertEqual(bytes(TileMap(300, 300, 0.5, 1234, 64).chunk(1, 2)), first)
+        self.assertNotEqual(bytes(TileMap(300, 300, 0.5, 99, 64).chunk(1, 2)), first)
+
+    def test_map_border_is_destructible(self):
+        """Test if the outer ring is destructible, including inside the partial last chunk."""
+        empty = TileMap(100, 100, density=0.0, seed=1, chunk_size=64)
+        for row, col in ((0, 50), (99, 70), (70, 0), (70, 99)):
+            self.assertEqual(empty.get(row, col), DESTRUCTIBLE)
+        self.assertEqual(empty.get(50, 50), SOLID)
+        self.assertIsNone(empty.get(100, 50))
+        self.assertIsNone(empty.get(-1, 0))
+
+    def test_stream_keeps_damaged_chunks(self):
+        """Test if streaming away evicts clean chunks but keeps chunks with destroyed cells."""
+        self.map.stream(0, 0, radius=1)
+        self.assertEqual(set(self.map.chunks), {(0, 0), (0, 1), (1, 0), (1, 1)})
+        self.map.set(70, 70, DESTROYED) # Chunk (1, 1)
+        self.map.stream(299, 299, radius=1)
+        self.assertEqual(set(self.map.chunks), {(1, 1), (3, 3), (3, 4), (4, 3), (4, 4)})
+        self.assertEqual(self.map.get(70, 70), DESTROYED)
+
+    def test_codes_at_matches_get_across_edges(self):
+        """Test if the vectorised lookup agrees with get() at chunk seams and reports OUTSIDE off the map."""
+        rows = np.array([0, 63, 64, 63, 64, 299, 299, -1, 300, 5])
+        cols = np.array([0, 63, 64, 64, 63, 299, 256, 5, 5, -3])
+        codes = self.map.codes_at(rows, cols)
+        expected = [self.map.get(r, c) for r, c in zip(rows.tolist(), cols.tolist())]
+        self.assertEqual(codes.tolist(), [OUTSIDE if e is None else e for e in expected])
+        self.assertEqual(codes[-3:].tolist(), [OUTSIDE] * 3)
+
+TILE = 10
+
+def open_world(rows=12, cols=12):
+    """A map of open floor inside a destructible border."""
+    world = World(cols * TILE, rows * TILE, TILE)
+    world.rows, world.cols = rows, cols
+    world.map = TileMap(rows, cols, density=0.0, seed=1)
+    return world
+
+def center(row, col):
+    return col * TILE + TILE // 2, row * TILE + TILE // 2
+
+class TestFlowField(unittest.TestCase):
+
+    def setUp(self):
+        self.world = open_world()
+        for row in range(1, 10): # Wall down column 5, open only at row 10
+            self.world.map.set(row, 5, DESTRUCTIBLE)
+        self.flow = self.world.flow
+
+    def test_bfs_walks_around_walls(self):
+        """Test if distances follow the only gap in the wall and walls stay unreachable."""
+        self.flow.update(*center(2, 2))
+        self.assertEqual(self.flow.distance(2, 2), 0)
+        self.assertEqual(self.flow.distance(2, 4), 2)
+        self.assertEqual(self.flow.distance(2, 7), 8 + 5 + 8) # Down to row 10, across, back up
+        self.assertEqual(self.flow.distance(5, 5), -1)
+        self.assertEqual(self.flow.distance(0, 0), -1) # Border
+
+    def test_rebuilds_only_on_cell_or_map_change(self):
+        """Test if moving within a cell is free while a new cell or a destroyed tile rebuilds."""
+        self.assertTrue(self.flow.update(*center(2, 2)))
+        self.assertFalse(self.flow.update(center(2, 2)[0] + 3, center(2, 2)[1] - 3))
+        self.assertEqual(self.flow.rebuilds, 1)
+        self.assertTrue(self.flow.update(*center(3, 2)))
+        self.world.destroy_cell(2, 5) # Opens a gap next to the player
+        self.assertTrue(self.flow.update(*center(3, 2)))
+        self.assertEqual(self.flow.rebuilds, 3)
+        self.assertEqual(self.flow.distance(2, 7), 1 + 5) # Up one, then straight through the gap
+
+    def test_next_waypoint(self):
+        """Test if waypoints step one cell closer, and are None at the player or when unreachable."""
+        self.flow.update(*center(2, 2))
+        x, y = self.flow.next_waypoint(*center(2, 7))
+        self.assertEqual(self.flow.distance(y // TILE, x // TILE), self.flow.distance(2, 7) - 1)
+        self.assertIsNone(self.flow.next_waypoint(*center(2, 2)))
+        for row, col in ((6, 7), (8, 7), (7, 6), (7, 8)): # Box in cell (7, 7)
+            self.world.map.set(row, col, DESTRUCTIBLE)
+        self.world.version += 1
+        self.flow.update(*center(2, 2))
+        self.assertIsNone(self.flow.next_waypoint(*center(7, 7)))
+
+    def test_field_is_clipped_to_radius(self):
+        """Test if cells outside the search window report no path instead of failing."""
+        world = open_world(rows=100, cols=100)
+        world.flow.radius = 10
+        world.flow.update(*center(50, 50))
+        self.assertEqual(world.flow.distance(50, 60), 10)
+        self.assertEqual(world.flow.distance(50, 61), -1)
+        self.assertIsNone(world.flow.next_waypoint(*center(50, 80)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from news_pipeline import classify, parse_feed, NewsStore, MAX_ITEMS_PER_SOURCE
+
+RSS = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel>
+  <item>
+    <title>Patch now: RCE in OpenSSH</title>
+    <link>https://example.com/ssh</link>
+    <description>&lt;p&gt;Fixed in   9.8&lt;/p&gt;</description>
+    <pubDate>Tue, 02 Jul 2024 10:00:00 +0000</pubDate>
+  </item>
+  <item>
+    <title>Kernel 6.10 released</title>
+    <link>https://example.com/kernel</link>
+  </item>
+  <item><title>No link, skipped</title></item>
+</channel></rss>"""
+
+ATOM = b"""<?xml version="1.0"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <title>CVE-2024-3094 backdoor in xz</title>
+    <link href="https://example.com/xz"/>
+    <summary>Supply chain compromise</summary>
+    <updated>2024-03-29T12:00:00Z</updated>
+  </entry>
+</feed>"""
+
+class TestClassify(unittest.TestCase):
+
+    def test_critical_keywords(self):
+        """Test if real threat terms are flagged."""
+        for text in ("Zero-day in Chrome", "0-day exploit chain", "RCE in OpenSSH", "Fix for CVE-2024-3094", "Ransomware hits hospital"):
+            self.assertEqual(classify(text, ""), "CRITICAL", text)
+        self.assertEqual(classify("Weekly roundup", "Vendor confirms data breach"), "CRITICAL")
+
+    def test_substrings_are_not_critical(self):
+        """Test if keywords inside other words do not trigger (e.g. 'rce' in 'source')."""
+        for text in ("Open source release notes", "Firefox adds new resource hints", "Hypercritical review", "Breaching the cloud"):
+            self.assertEqual(classify(text, ""), "INFO", text)
+
+class TestParseFeed(unittest.TestCase):
+
+    def test_rss(self):
+        """Test if RSS items are parsed, cleaned and classified."""
+        items = parse_feed("Test", RSS)
+        self.assertEqual([i["link"] for i in items], ["https://example.com/ssh", "https://example.com/kernel"])
+        first = items[0]
+        self.assertEqual(first["summary"], "Fixed in 9.8")
+        self.assertEqual(first["priority"], "CRITICAL")
+        self.assertEqual(first["source"], "Test")
+        self.assertRegex(first["timestamp"], r"^2024-07-0[12] \d\d:00:00$")
+        self.assertEqual(items[1]["priority"], "INFO")
+
+    def test_atom(self):
+        """Test if Atom entries use href links and summary text."""
+        items = parse_feed("Atom", ATOM)
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["link"], "https://example.com/xz")
+        self.assertEqual(items[0]["summary"], "Supply chain compromise")
+        self.assertEqual(items[0]["priority"], "CRITICAL")
+
+    def test_item_cap(self):
+        """Test if a long feed is cut to MAX_ITEMS_PER_SOURCE."""
+        body = "<rss><channel>" + "".join(f"<item><title>t{i}</title><link>https://e/{i}</link></item>" for i in range(MAX_ITEMS_PER_SOURCE + 5)) + "</channel></rss>"
+        self.assertEqual(len(parse_feed("Big", body.encode())), MAX_ITEMS_PER_SOURCE)
+
+def item(link, headline="Headline"):
+    return {"headline": headline, "link": link, "summary": "", "source": "Test", "priority": "INFO", "timestamp": "2024-01-01 00:00:00"}
+
+class TestNewsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "intel", "news.db")
+        self.store = NewsStore(self.path)
+
+    def tearDown(self):
+        self.store.conn.close()
+        shutil.rmtree(self.dir)
+
+    def count(self):
+        return self.store.conn.execute("SELECT COUNT(*) FROM news_history").fetchone()[0]
+
+    def test_dedupes_by_link(self):
+        """Test if repeats within a batch and across scans are stored once."""
+        new = self.store.insert([item("https://e/1"), item("https://e/2"), item("https://e/1")])
+        self.assertEqual([i["link"] for i in new], ["https://e/1", "https://e/2"])
+        self.assertEqual(self.store.insert([item("https://e/2"), item("https://e/3")]), [item("https://e/3")])
+        self.assertEqual(self.count(), 3)
+
+    def test_dedupes_rows_from_other_writers(self):
+        """Test if rows another process (briefing.py) inserts later are not duplicated."""
+        other = sqlite3.connect(self.path)
+        with other: other.execute("INSERT INTO news_history (headline, priority, source, link, summary, timestamp) VALUES ('h', 'INFO', 'briefing', 'https://e/9', '', '')")
+        other.close()
+        self.assertEqual(self.store.insert([item("https://e/9")]), [])
+        self.assertEqual(self.count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from comfy_client import RenderRequest
+from render_cache import RenderCache, cache_key, normalize_prompt
+
+def req(text, seed=7):
+    return RenderRequest(text, "", seed=seed)
+
+class TestRenderCache(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    async def asyncTearDown(self):
+        shutil.rmtree(self.dir)
+
+    def files(self, request):
+        key = cache_key(request)
+        return sorted(n for n in os.listdir(self.dir) if n.startswith(key))
+
+    async def test_roundtrip_and_unseeded_bypass(self):
+        """Test if seeded renders come back from disk and unseeded ones are never cached."""
+        cache = RenderCache(self.dir, 1000)
+        await cache.put(req("A Cat,  sunset"), [b"one", b"two"])
+        self.assertEqual(await cache.get(req("a cat, sunset,")), [b"one", b"two"]) # Normalised prompt hits
+        await cache.put(req("dog", seed=None), [b"x"])
+        self.assertIsNone(await cache.get(req("dog", seed=None)))
+        self.assertEqual(cache.stats(), {"entries": 1, "bytes": 6, "hits": 1, "misses": 0})
+        self.assertEqual(normalize_prompt(" A  Cat ,, sunset "), "a cat, sunset")
+
+    async def test_lru_eviction_under_size_cap(self):
+        """Test if the least recently used entry (not the oldest written) is evicted, files included."""
+        cache = RenderCache(self.dir, 250)
+        a, b, c = req("a"), req("b"), req("c")
+        await cache.put(a, [b"x" * 100])
+        await cache.put(b, [b"x" * 100])
+        await cache.get(a) # a becomes most recent
+        await cache.put(c, [b"x" * 100])
+        self.assertIsNone(await cache.get(b))
+        self.assertEqual(self.files(b), [])
+        self.assertIsNotNone(await cache.get(a))
+        self.assertIsNotNone(await cache.get(c))
+        self.assertEqual(cache.stats()["bytes"], 200)
+
+    async def test_order_restored_from_mtimes(self):
+        """Test if a restart rebuilds size and LRU order from the files on disk."""
+        cache = RenderCache(self.dir, 250)
+        a, b = req("a"), req("b")
+        await cache.put(a, [b"x" * 60, b"y" * 40])
+        await cache.put(b, [b"x" * 100])
+        for name in self.files(a): os.utime(os.path.join(self.dir, name), (2000, 2000)) # a used last
+        for name in self.files(b): os.utime(os.path.join(self.dir, name), (1000, 1000))
+        restarted = RenderCache(self.dir, 250)
+        self.assertEqual(restarted.stats()["entries"], 2)
+        self.assertEqual(restarted.stats()["bytes"], 200)
+        await restarted.put(req("c"), [b"x" * 100])
+        self.assertEqual(self.files(b), [])
+        self.assertEqual(await restarted.get(a), [b"x" * 60, b"y" * 40])
+
+    async def test_unreadable_entry_is_dropped(self):
+        """Test if an entry whose files vanished counts as a miss and leaves the index."""
+        cache = RenderCache(self.dir, 1000)
+        a = req("a")
+        await cache.put(a, [b"png"])
+        for name in self.files(a): os.remove(os.path.join(self.dir, name))
+        self.assertIsNone(await cache.get(a))
+        self.assertEqual(cache.stats(), {"entries": 0, "bytes": 0, "hits": 0, "misses": 1})
+
+if __name__ == '__main__':
+    unittest.main()
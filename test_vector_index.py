@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from vector_index import VectorIndex
+
+def vec(*xs):
+    return np.array(xs, dtype=np.float32)
+
+class TestVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fill(self, index):
+        index.add([vec(1, 0, 0), vec(0, 1, 0)], [{"kind": "intel", "ref": 1, "name": "a"}, {"kind": "intel", "ref": 2, "name": "b"}])
+        index.add([vec(0, 0, 1)], [{"kind": "chat", "channel": 7, "name": "c"}])
+
+    def names(self, hits):
+        return [m["name"] for _, m in hits]
+
+    def test_add_search_reload(self):
+        """Test if search ranks and filters, and a reload serves the same index."""
+        index = VectorIndex(self.path, model="m")
+        self.fill(index)
+        self.assertEqual(self.names(index.search(vec(1, 0.2, 0), k=2)), ["a", "b"])
+        self.assertEqual(self.names(index.search(vec(1, 0, 0), kind="chat", channel=7)), ["c"])
+        self.assertEqual(index.search(vec(1, 0, 0), kind="chat", channel=8, min_score=0.0), [])
+        reloaded = VectorIndex(self.path, model="m")
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.last_ref("intel"), 2)
+        self.assertEqual(self.names(reloaded.search(vec(0, 1, 0), k=1)), ["b"])
+
+    def test_other_model_starts_fresh(self):
+        """Test if an index built by another embedding model is discarded."""
+        self.fill(VectorIndex(self.path, model="m"))
+        self.assertEqual(len(VectorIndex(self.path, model="other")), 0)
+
+    def test_extra_vector_is_truncated(self):
+        """Test if a vector without metadata (crash between the writes) is cut, so later rows stay aligned."""
+        self.fill(VectorIndex(self.path, model="m"))
+        with open(self.path + ".f32", "ab") as f: f.write(vec(0.5, 0.5, 0).tobytes())
+        index = VectorIndex(self.path, model="m")
+        self.assertEqual(len(index), 3)
+        index.add([vec(1, 1, 1)], [{"kind": "intel", "ref": 3, "name": "d"}])
+        score, meta = VectorIndex(self.path, model="m").search(vec(1, 1, 1), k=1)[0]
+        self.assertEqual(meta["name"], "d")
+        self.assertAlmostEqual(score, 1.0, places=5)
+
+    def test_partial_rows_are_dropped(self):
+        """Test if a half-written vector and a half-written metadata line do not stop the load."""
+        self.fill(VectorIndex(self.path, model="m"))
+        with open(self.path + ".f32", "ab") as f: f.write(b"\x00" * 5)
+        with open(self.path + ".meta.jsonl", "a") as f: f.write('{"kind": "intel", "na')
+        index = VectorIndex(self.path, model="m")
+        self.assertEqual(len(index), 3)
+        self.assertEqual(os.path.getsize(self.path + ".f32"), 3 * 3 * 4)
+        index.add([vec(1, 1, 1)], [{"kind": "intel", "ref": 3, "name": "d"}])
+        self.assertEqual(self.names(VectorIndex(self.path, model="m").search(vec(1, 1, 1), k=1)), ["d"])
+
+    def test_extra_metadata_is_truncated(self):
+        """Test if metadata without a vector is dropped from the file too."""
+        self.fill(VectorIndex(self.path, model="m"))
+        with open(self.path + ".meta.jsonl", "a") as f: f.write('{"kind": "intel", "ref": 9, "name": "ghost"}\n')
+        index = VectorIndex(self.path, model="m")
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.last_ref("intel"), 2)
+        index.add([vec(1, 1, 1)], [{"kind": "intel", "ref": 3, "name": "d"}])
+        self.assertEqual(self.names(VectorIndex(self.path, model="m").search(vec(1, 1, 1), k=1)), ["d"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+INDEX_PATH = "clair_vectors" # -> clair_vectors.f32 (raw float32 rows) + clair_vectors.meta.jsonl
+INITIAL_CAPACITY = 1024
+KINDS = ["intel", "chat"]
+
+class VectorIndex:
+    """Append-only cosine-similarity index: unit-normalised float32 rows plus one JSON metadata line each.
+
+    Vectors live on disk as a flat float32 file (memory-mapped at load) and in memory as a
+    preallocated matrix that doubles on growth; search is a single matrix-vector product.
+    Methods are blocking and thread-safe; the bot calls them through asyncio.to_thread.
+    """
+    def __init__(self, path=INDEX_PATH, model=None):
+        self.vec_path = f"{path}.f32"
+        self.meta_path = f"{path}.meta.jsonl"
+        self.model = model
+        self.dim = None
+        self.meta = []
+        self._matrix = None
+        self._kinds = None # Per-row kind / channel arrays for vectorised filtering
+        self._channels = None
+        self._last_ref = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    # --- STORAGE ---
+    def _load(self):
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.vec_path): return
+        lines = []
+        with open(self.meta_path) as f:
+            for line in f:
+                if not line.strip(): continue
+                try: lines.append(json.loads(line))
+                except ValueError: break # Half-written last line
+        if not lines or lines[0].get("model") != self.model:
+            logging.info("Vector index built with another embedding model, starting fresh")
+            self._reset_files()
+            return
+        self.dim = lines[0]["dim"]
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        count = min(os.path.getsize(self.vec_path) // row_bytes, len(lines) - 1) # A crash between the two appends leaves them uneven
+        self.meta = lines[1:count + 1]
+        self._truncate_files(count * row_bytes)
+        rows = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(count, self.dim)) if count else np.zeros((0, self.dim), np.float32)
+        self._allocate(max(INITIAL_CAPACITY, count * 2))
+        self._matrix[:count] = rows[:count]
+        for i, m in enumerate(self.meta): self._index_meta(i, m)
+        logging.info(f"Vector index loaded: {count} vectors x {self.dim}d")
+
+    def _truncate_files(self, vec_bytes):
+        # Cut both files back to the rows they have in common, so later appends stay aligned
+        if os.path.getsize(self.vec_path) != vec_bytes:
+            logging.warning(f"Vector index files uneven, truncating to {len(self.meta)} rows")
+            with open(self.vec_path, "r+b") as f: f.truncate(vec_bytes)
+        with open(self.meta_path) as f: stored = sum(1 for line in f if line.strip())
+        if stored != len(self.meta) + 1:
+            tmp = self.meta_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.write(json.dumps({"model": self.model, "dim": self.dim}) + "\n")
+                for m in self.meta: f.write(json.dumps(m) + "\n")
+            os.replace(tmp, self.meta_path)
+
+    def _reset_files(self):
+        for p in (self.vec_path, self.meta_path):
+            if os.path.exists(p): os.remove(p)
+
+    def _allocate(self, capacity):
+        matrix = np.zeros((capacity, self.dim), np.float32)
+        kinds = np.zeros(capacity, np.int8)
+        channels = np.zeros(capacity, np.int64)
+        if self._matrix is not None:
+            n = len(self.meta)
+            matrix[:n], kinds[:n], channels[:n] = self._matrix[:n], self._kinds[:n], self._channels[:n]
+        self._matrix, self._kinds, self._channels = matrix, kinds, channels
+
+    def _index_meta(self, i, m):
+        self._kinds[i] = KINDS.index(m["kind"])
+        self._channels[i] = m.get("channel") or 0
+        if m.get("ref") is not None: self._last_ref[m["kind"]] = max(self._last_ref.get(m["kind"], 0), m["ref"])
+
+    # --- API ---
+    def add(self, vectors, metas):
+        """Appends embeddings with their metadata dicts (must include 'kind')."""
+        if not len(vectors): return
+        vecs = _normalise(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vecs.shape[1]
+                self._reset_files()
+                with open(self.meta_path, "w") as f: f.write(json.dumps({"model": self.model, "dim": self.dim}) + "\n")
+                self._allocate(INITIAL_CAPACITY)
+            n = len(self.meta)
+            if n + len(vecs) > len(self._matrix): self._allocate(max(len(self._matrix) * 2, n + len(vecs)))
+            self._matrix[n:n + len(vecs)] = vecs
+            with open(self.vec_path, "ab") as f: f.write(vecs.tobytes())
+            with open(self.meta_path, "a") as f:
+                for m in metas: f.write(json.dumps(m) + "\n")
+            for i, m in enumerate(metas): self._index_meta(n + i, m)
+            self.meta.extend(metas)
+
+    def search(self, vector, k=3, kind=None, channel=None, min_score=0.0):
+        """Top-k (score, meta) by cosine similarity, optionally filtered by kind and channel."""
+        with self._lock:
+            n = len(self.meta)
+            if not n: return []
+            matrix, kinds, channels, meta = self._matrix[:n], self._kinds[:n], self._channels[:n], self.meta
+        query = _normalise(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        scores = matrix @ query
+        if kind is not None: scores = np.where(kinds == KINDS.index(kind), scores, -1.0)
+        if channel is not None: scores = np.where(channels == channel, scores, -1.0)
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), meta[i]) for i in top if scores[i] >= min_score]
+
+    def last_ref(self, kind):
+        """Highest 'ref' stored for a kind, for incremental indexing of append-only tables."""
+        return self._last_ref.get(kind, 0)
+
+    def __len__(self):
+        return len(self.meta)
+
+def _normalise(vecs):
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
@@ -0,0 +1,85 @@
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+VISION_INPUT_SIZE = 672 # llava-1.6 tiles at 336/672px; anything larger is resized by the encoder anyway
+JPEG_QUALITY = 90
+MAX_IMAGES = 4 # Per message
+MAX_ATTACHMENT_BYTES = 25 * 1024**2
+CACHE_ENTRIES = 256
+
+def encode_for_vision(data, max_side=VISION_INPUT_SIZE, quality=JPEG_QUALITY):
+    """Downscales to `max_side` on the long edge and re-encodes as JPEG; returns base64 text. Blocking."""
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format == "JPEG" and max(img.size) <= max_side and img.getexif().get(0x0112, 1) == 1:
+            return base64.b64encode(data).decode('utf-8') # Already small and upright, skip the re-encode
+        img.draft("RGB", (max_side, max_side)) # JPEG only: decode at reduced scale instead of full res
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            flat = Image.new("RGB", img.size, (255, 255, 255))
+            flat.paste(img, mask=img.getchannel("A"))
+            img = flat
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=quality, optimize=True)
+    return base64.b64encode(out.getvalue()).decode('utf-8')
+
+class VisionPreprocessor:
+    """Turns message attachments into llava-ready base64 payloads.
+
+    Downloads run concurrently and decoding/resizing runs in worker threads; results are cached
+    by content hash (so re-posted images are free) and by attachment id (so they skip the download).
+    """
+    def __init__(self, max_side=VISION_INPUT_SIZE, quality=JPEG_QUALITY, max_images=MAX_IMAGES, cache_entries=CACHE_ENTRIES):
+        self.max_side = max_side
+        self.quality = quality
+        self.max_images = max_images
+        self.cache_entries = cache_entries
+        self._payloads = OrderedDict() # content sha1 -> base64 payload
+        self._by_id = OrderedDict()    # attachment id -> content sha1
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, table, key, value):
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.cache_entries: table.popitem(last=False)
+
+    async def _prepare_one(self, attachment):
+        digest = self._by_id.get(attachment.id)
+        if digest in self._payloads:
+            self.hits += 1
+            self._payloads.move_to_end(digest)
+            return self._payloads[digest]
+        if attachment.size and attachment.size > MAX_ATTACHMENT_BYTES:
+            logging.warning(f"Skipping oversized image {attachment.filename} ({attachment.size} bytes)")
+            return None
+        data = await attachment.read()
+        digest = hashlib.sha1(data).hexdigest()
+        self._remember(self._by_id, attachment.id, digest)
+        if digest in self._payloads:
+            self.hits += 1
+            self._payloads.move_to_end(digest)
+            return self._payloads[digest]
+        self.misses += 1
+        payload = await asyncio.to_thread(encode_for_vision, data, self.max_side, self.quality)
+        self._remember(self._payloads, digest, payload)
+        return payload
+
+    async def prepare(self, attachments):
+        """Base64 payloads for up to `max_images` attachments, in order; unreadable images are skipped."""
+        results = await asyncio.gather(*(self._prepare_one(a) for a in attachments[:self.max_images]), return_exceptions=True)
+        payloads = []
+        for attachment, result in zip(attachments, results):
+            if isinstance(result, Exception):
+                logging.error(f"Image Load Error ({attachment.filename}): {result}")
+            elif result:
+                payloads.append(result)
+        return payloads
@@ -0,0 +1,111 @@
+import json
+import math
+import os
+
+WORKFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ComfyUI's websocket output node streams finished images as binary frames instead of writing PNGs
+WS_OUTPUT_NODE = "SaveImageWebsocket"
+
+# Template name -> file plus the prompt dressing added around the user's text
+TEMPLATES = {
+    "lightning": {
+        "file": "workflow_lightning.json", # Juggernaut Lightning: 6 steps, fast
+        "positive_suffix": ", masterpiece, cinematic lighting, 8k, highly detailed",
+        "negative_base": "worst quality, low quality, bad anatomy, blur, noisy, distorted",
+        "websocket_output": True,
+    },
+    "flux": {
+        "file": "workflow_api.json", # Flux dev GGUF: slower, higher quality
+        "positive_suffix": "",
+        "negative_base": "",
+        "websocket_output": True,
+    },
+}
+DEFAULT_TEMPLATE = "lightning"
+
+ASPECT_RATIOS = ["1:1", "16:9", "9:16", "4:3", "3:4", "3:2", "2:3"]
+
+def resolution_for(aspect_ratio, base=1024, multiple=64):
+    """Width/height for an "W:H" ratio at roughly base*base pixels, snapped to the latent grid."""
+    try:
+        w, h = (float(x) for x in aspect_ratio.split(":"))
+    except (AttributeError, ValueError):
+        w, h = 1, 1
+    width = math.sqrt(base * base * w / h)
+    snap = lambda v: max(multiple, int(round(v / multiple)) * multiple)
+    return snap(width), snap(width * h / w)
+
+class WorkflowTemplate:
+    """A parsed API-format graph plus the (node_id, input) slots that get patched per request.
+
+    Slots are found once by walking from the KSampler, so any graph with the usual
+    sampler -> encoders / latent / loader shape works without hand-written node ids.
+    """
+    def __init__(self, name, graph, positive_suffix="", negative_base="", websocket_output=False):
+        self.name = name
+        self.graph = graph
+        self.positive_suffix = positive_suffix
+        self.negative_base = negative_base
+        self.websocket_output = websocket_output
+        self.save_nodes = [n for n, node in graph.items() if node['class_type'] == "SaveImage"]
+        self.slots = self._find_slots()
+        self.defaults = {k: graph[n]['inputs'][i] for k, (n, i) in self.slots.items()}
+
+    @classmethod
+    def load(cls, name, path, **options):
+        with open(path) as f:
+            return cls(name, json.load(f), **options)
+
+    def _find_slots(self):
+        sampler_id = next(n for n, node in self.graph.items() if node['class_type'] in ("KSampler", "KSamplerAdvanced"))
+        sampler = self.graph[sampler_id]['inputs']
+        latent_id = sampler['latent_image'][0]
+        slots = {
+            "seed": (sampler_id, "seed" if "seed" in sampler else "noise_seed"),
+            "steps": (sampler_id, "steps"),
+            "cfg": (sampler_id, "cfg"),
+            "sampler": (sampler_id, "sampler_name"),
+            "positive": (sampler['positive'][0], "text"),
+            "negative": (sampler['negative'][0], "text"),
+            "width": (latent_id, "width"),
+            "height": (latent_id, "height"),
+            "batch_size": (latent_id, "batch_size"),
+        }
+        for node_id, node in self.graph.items():
+            for key in ("ckpt_name", "unet_name"):
+                if key in node['inputs']: slots["checkpoint"] = (node_id, key)
+        return slots
+
+    @property
+    def checkpoint(self):
+        return self.defaults.get("checkpoint")
+
+    def render(self, positive, negative="", **values):
+        """Returns a per-request graph. Copy-on-write: only patched nodes are copied, the rest are shared."""
+        values["positive"] = positive + self.positive_suffix
+        values["negative"] = ", ".join(t for t in (self.negative_base, negative) if t)
+        graph = dict(self.graph)
+        for key, value in values.items():
+            if value is None or key not in self.slots: continue
+            node_id, input_name = self.slots[key]
+            if graph[node_id] is self.graph[node_id]:
+                graph[node_id] = dict(self.graph[node_id], inputs=dict(self.graph[node_id]['inputs']))
+            graph[node_id]['inputs'][input_name] = value
+        if self.websocket_output:
+            for node_id in self.save_nodes:
+                graph[node_id] = {"class_type": WS_OUTPUT_NODE, "inputs": {"images": self.graph[node_id]['inputs']['images']},
+                                  "_meta": {"title": "Save Image (Websocket)"}}
+        return graph
+
+class TemplateRegistry:
+    def __init__(self, templates=TEMPLATES, directory=WORKFLOW_DIR):
+        self.templates = {}
+        for name, spec in templates.items():
+            options = {k: v for k, v in spec.items() if k != "file"}
+            self.templates[name] = WorkflowTemplate.load(name, os.path.join(directory, spec["file"]), **options)
+
+    def get(self, name):
+        return self.templates.get(name) or self.templates[DEFAULT_TEMPLATE]
+
+registry = TemplateRegistry()